@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rss.middleware.InstrumentationMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -49,9 +51,10 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "django.middleware.cache.UpdateCacheMiddleware",
+    "rss.page_cache.UpdateCacheMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.cache.FetchFromCacheMiddleware",
+    "rss.middleware.TimedFetchFromCacheMiddleware",
+    "rss.admission.AdmissionControlMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
 
@@ -126,18 +129,38 @@ ELASTICSEARCH_DSL = {
 }
 
 # Cache configuration
+# Job card fragments (see rss/fragments.py) have their own cache, so that the
+# hundreds of cards of a listing never cull pages, search results or validators,
+# and so do the rate limiting token buckets (see rss/admission.py)
 if DEBUG:
     CACHES = {
         "default": {
             "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        }
+        },
+        "cards": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        },
+        "admission": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        },
     }
 else:
     CACHES = {
         "default": {
             "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
             "LOCATION": "junojobs",
-        }
+            "OPTIONS": {"MAX_ENTRIES": env.int("CACHE_MAX_ENTRIES", default=5000)},
+        },
+        "cards": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "junojobs-cards",
+            "OPTIONS": {"MAX_ENTRIES": env.int("CARD_CACHE_MAX_ENTRIES", default=20000)},
+        },
+        "admission": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "junojobs-admission",
+            "OPTIONS": {"MAX_ENTRIES": env.int("ADMISSION_CACHE_MAX_ENTRIES", default=10000)},
+        },
     }
 
 # Crispy Forms
@@ -148,7 +171,7 @@ TINYMCE_JS_URL = "/static/js/tinymce/tinymce.min.js"
 TINYMCE_JS_ROOT = "/static/js/tinymce/"
 TINYMCE_DEFAULT_CONFIG = {"theme": "silver", "relative_urls": False}
 
-# Popular searches configuration
+# Popular searches shown until the query log has been aggregated (see rss/querylog.py)
 POPULAR = [
     {"name": "Ruby on Rails", "search": '"Ruby on Rails" OR "Rails"'},
     {"name": "Django", "search": "Django"},
@@ -167,3 +190,114 @@ CACHE_TIME_LANDING = 60 * 60  # 1 hour
 CACHE_TIME_JOBS = 60 * 15  # 15 minutes
 CACHE_TIME_SEARCH = 60 * 5  # 5 minutes
 CACHE_TIME_JOB_DETAIL = 60 * 60 * 24 * 7  # 1 week
+CACHE_TIME_CARD = 60 * 60  # rendered job cards, keeps the NEW badge roughly current
+CACHE_TIME_RELATED = 60 * 60 * 6  # related jobs of a job page, refreshed separately
+CACHE_TIME_FEED = 60 * 60 * 24  # feed XML, also keyed by the index generation
+RELATED_JOBS_COUNT = 6
+# Cached pages are stored compressed once (see rss/page_cache.py)
+PAGE_CACHE_GZIP_LEVEL = 9
+PAGE_CACHE_BROTLI_QUALITY = 9
+
+# Conditional responses (ETag / Last-Modified, see rss/generation.py)
+# How long the per-source index generation is trusted before asking ES again
+INDEX_GENERATION_TTL = env.int("INDEX_GENERATION_TTL", default=60)
+
+# Query log (see rss/querylog.py), an empty QUERY_LOG_DIR disables it
+QUERY_LOG_DIR = env("QUERY_LOG_DIR", default=str(BASE_DIR / "var" / "querylog"))
+QUERY_LOG_ROUTES = ("/search/", "/api/v1/search/")
+QUERY_LOG_BATCH_SIZE = 500
+QUERY_LOG_FLUSH_SECONDS = 60
+QUERY_LOG_WINDOW_DAYS = 7  # aggregated by `manage.py aggregate_queries`, older logs are deleted
+QUERY_LOG_TOP = 100  # heaviest queries kept, also the warm-up set
+QUERY_POPULAR_SIZE = 8
+QUERY_POPULAR_MIN_COUNT = 5
+CACHE_TIME_POPULAR = 60 * 10
+
+# Job sources (see rss/sources.py)
+SOURCES_PATH = env("SOURCES_PATH", default=str(BASE_DIR / "node" / "sources.json"))
+# Mapping the job index is created with (see rss/views.py)
+MAPPINGS_PATH = env("MAPPINGS_PATH", default=str(BASE_DIR / "node" / "mappings.json"))
+# How often the per-source stats (job count, newest job, last fetch) are refreshed
+SOURCE_STATS_REFRESH_SECONDS = env.int("SOURCE_STATS_REFRESH_SECONDS", default=300)
+# Part of every validator, so that a deploy invalidates pages cached by clients
+RELEASE = env("RELEASE", default=env("RAILWAY_GIT_COMMIT_SHA", default=""))
+
+# Ingest schedule (node/ingest.js runs daily at 00:00 UTC), advertised to
+# feed readers as the time until the next update
+INGEST_INTERVAL_MINUTES = env.int("INGEST_INTERVAL_MINUTES", default=24 * 60)
+INGEST_OFFSET_MINUTES = env.int("INGEST_OFFSET_MINUTES", default=0)  # after 00:00 UTC
+INGEST_DURATION_MINUTES = 15
+
+# Search suggestions (in-process prefix index, see rss/suggest.py)
+SUGGEST_REFRESH_SECONDS = 60 * 60
+SUGGEST_TITLE_SAMPLE = 2000  # latest job titles scanned for frequent terms
+SUGGEST_TITLE_TERMS = 500  # most frequent title terms added to the index
+SUGGEST_MAX_RESULTS = 10
+
+# Job alerts for saved searches (see rss/alerts.py)
+# Newly ingested jobs are scrolled and matched in batches of this size
+ALERTS_BATCH_SIZE = env.int("ALERTS_BATCH_SIZE", default=500)
+# Absolute URL used for links in alert emails
+ALERTS_BASE_URL = env("ALERTS_BASE_URL", default="https://juno.rohitagarwal.dev")
+# Alert signups (confirmation emails): (rate/s, burst) per client and per address
+ALERTS_SIGNUP_CLIENT_RATE = (1 / 60, 5)
+ALERTS_SIGNUP_EMAIL_RATE = (1 / 3600, 3)
+EMAIL_BACKEND = env(
+    "EMAIL_BACKEND", default="django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_HOST = env("EMAIL_HOST", default="localhost")
+EMAIL_PORT = env.int("EMAIL_PORT", default=25)
+EMAIL_HOST_USER = env("EMAIL_HOST_USER", default="")
+EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD", default="")
+EMAIL_USE_TLS = env.bool("EMAIL_USE_TLS", default=False)
+DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="Juno Jobs <alerts@juno.rohitagarwal.dev>")
+
+# Instrumentation
+# /metrics is only served to these addresses (Prometheus scraper on the host)
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
+# Searches slower than this are counted and written to the "rss.slowlog" logger
+ES_SLOW_QUERY_MS = env.int("ES_SLOW_QUERY_MS", default=1000)
+# Re-run slow searches with `profile: true` and log the profile (expensive, opt-in)
+ES_PROFILE_SLOW_QUERIES = env.bool("ES_PROFILE_SLOW_QUERIES", default=False)
+
+# Admission control (see rss/admission.py)
+ADMISSION_CONTROL = env.bool("ADMISSION_CONTROL", default=True)
+# Route prefix: (per client rate/s, per client burst, per route rate/s, per route burst)
+ADMISSION_ROUTES = {
+    "/search/": (1.0, 20, 20.0, 100),
+    "/search/feed/": (0.2, 10, 10.0, 50),
+    "/source/": (1.0, 20, 20.0, 100),
+    "/source/feed/": (0.2, 10, 10.0, 50),
+    "/api/": (2.0, 40, 20.0, 100),
+    "/related/": (2.0, 20, 20.0, 100),
+    "/job/": (2.0, 40, 40.0, 200),
+}
+ADMISSION_MAX_FROM = 1000  # deepest `from` offset of a listing page
+ADMISSION_MAX_FILTER_VALUES = 10  # source + category values in one request
+
+# Query cost guard (see rss/query_cost.py)
+QUERY_MAX_CLAUSES = 32  # more terms are downgraded to a multi_match of the first ones
+QUERY_MAX_DEPTH = 4  # deepest parenthesis nesting of a query_string
+QUERY_MAX_EXPANSIONS = 256  # estimated index terms matched by wildcards and fuzzy terms
+QUERY_REJECT_CLAUSES = 128  # refused by admission control with a 400
+QUERY_MAX_LENGTH = 1000  # characters of `q`, refused by admission control with a 400
+# Search recognized skills/locations/seniority with terms filters on the fields
+# tagged at ingest; turn on once `manage.py tag_entities` has tagged old jobs
+ENTITY_FILTERS = env.bool("ENTITY_FILTERS", default=False)
+# Proxies in front of the app appending to X-Forwarded-For (1 on Railway)
+NUM_PROXIES = env.int("NUM_PROXIES", default=0)
+# Elasticsearch requests running at the same time, per process
+ES_MAX_IN_FLIGHT = env.int("ES_MAX_IN_FLIGHT", default=4)
+# Seconds a request waits for an Elasticsearch slot before getting a 503
+ES_QUEUE_TIMEOUT = env.float("ES_QUEUE_TIMEOUT", default=2.0)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "rss": {"handlers": ["console"], "level": "INFO"},
+    },
+}
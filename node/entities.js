@@ -0,0 +1,54 @@
+// Tags jobs with the skills, locations and seniority levels of vocabulary.json
+// found in their title and body, the vocabularies the web app's query parser
+// recognizes. Must stay in step with extract() in rss/entities.py.
+const vocabulary = require("./vocabulary.json");
+
+const FIELDS = ["skills", "locations", "seniority"];
+const TOKEN_RE = /[a-z0-9+#./-]+/g;
+const EDGES_RE = /^[./-]+|[./-]+$/g;
+
+// entry -> field, for one-word entries and entries of several words
+const words = new Map();
+const phrases = new Map();
+for (const field of FIELDS) {
+  for (const entry of vocabulary[field]) {
+    const index = entry.includes(" ") ? phrases : words;
+    if (!index.has(entry)) index.set(entry, field);
+  }
+}
+const longestPhrase = Math.max(1, ...[...phrases.keys()].map((p) => p.split(" ").length));
+
+function extractEntities(text) {
+  const found = {};
+  for (const field of FIELDS) found[field] = new Set();
+  const tokens = (text || "").toLowerCase().match(TOKEN_RE) || [];
+  const seen = [];
+  for (const token of tokens) {
+    const word = token.replace(EDGES_RE, "");
+    seen.push(word);
+    // ".net" and "ci/cd" as written, "python." and "python/django" by parts
+    if (words.has(token)) found[words.get(token)].add(token);
+    else if (words.has(word)) found[words.get(word)].add(word);
+    else {
+      for (const part of word.split("/")) {
+        if (words.has(part)) found[words.get(part)].add(part);
+      }
+    }
+  }
+  for (let size = 2; size <= longestPhrase; size++) {
+    for (let i = 0; i + size <= seen.length; i++) {
+      const phrase = seen.slice(i, i + size).join(" ");
+      if (phrases.has(phrase)) found[phrases.get(phrase)].add(phrase);
+    }
+  }
+  const result = {};
+  for (const field of FIELDS) result[field] = [...found[field]].sort();
+  return result;
+}
+
+function tagEntities(doc) {
+  Object.assign(doc, extractEntities(`${doc.title || ""} ${doc.body || ""}`));
+  return doc;
+}
+
+module.exports = { extractEntities, tagEntities };
@@ -1,7 +1,11 @@
 let es = require("./es-client");
 let RssParser = require("rss-parser");
-let sources = require("./sources.json");
+// Same SOURCES_PATH as the web app, relative paths are from the working directory
+let sources = process.env.SOURCES_PATH
+  ? require(require("path").resolve(process.env.SOURCES_PATH))
+  : require("./sources.json");
 let preproc = require("./preproc");
+const { tagEntities } = require("./entities");
 let userAgents = require("./user-agents.json").data;
 
 function getRandomUserAgent() {
@@ -36,7 +40,12 @@ async function bulkCreate(docs) {
   for (let i = 0; i < docs.length; i += BULK_SIZE) {
     const batch = docs.slice(i, i + BULK_SIZE);
     const body = [];
+    // ingestedAt lets the web app pick up each ingest batch (e.g. for job alerts)
+    const ingestedAt = new Date();
     for (const doc of batch) {
+      doc.ingestedAt = ingestedAt;
+      // skills/locations/seniority keyword fields, searched with terms filters
+      tagEntities(doc);
       body.push({ create: { _index: "rss", _id: doc.link } });
       body.push(doc);
     }
@@ -64,6 +73,19 @@ async function bulkCreate(docs) {
   return { created, conflicts, errored };
 }
 
+// Last successful fetch of every source, shown in the web app's source stats
+async function recordFetch(source, stats) {
+  try {
+    await es.index({
+      index: "rss-sources",
+      id: source.name,
+      body: { lastFetch: new Date(), items: stats.items, created: stats.created },
+    });
+  } catch (err) {
+    console.error(`cannot record fetch of ${source.name}:`, err && err.message ? err.message : err);
+  }
+}
+
 async function handleRss(source) {
   await new Promise((resolve) => setTimeout(resolve, 500));
   const userAgent = getRandomUserAgent();
@@ -104,13 +126,15 @@ async function handleRss(source) {
   console.log(
     `[${source.name}] items=${docs.length} created=${stats.created} conflicts=${stats.conflicts} errored=${stats.errored}`
   );
+  await recordFetch(source, { items: docs.length, created: stats.created });
 }
 
-async function handleItems(items) {
+async function handleItems(source, items) {
   const stats = await bulkCreate(items);
   console.log(
     `[special] items=${items.length} created=${stats.created} conflicts=${stats.conflicts} errored=${stats.errored}`
   );
+  await recordFetch(source, { items: items.length, created: stats.created });
 }
 
 async function main() {
@@ -122,7 +146,7 @@ async function main() {
         await handleRss(source);
       } else if (source.protocol === "special") {
         const items = await source.handleSpecial(source);
-        if (items && items.length) await handleItems(items);
+        if (items && items.length) await handleItems(source, items);
       }
     } catch (err) {
       console.error(`source ${source.name} failed:`, err && err.message ? err.message : err);
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Feedback
+from .models import AlertRun, Feedback, PopularQuery, SavedSearch
 
 
 class FeedbackAdmin(admin.ModelAdmin):
@@ -7,3 +7,23 @@ class FeedbackAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Feedback, FeedbackAdmin)
+
+
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ('query', 'email', 'created')
+    search_fields = ('query', 'email')
+
+
+class AlertRunAdmin(admin.ModelAdmin):
+    list_display = ('started', 'checkpoint', 'docs', 'saved_searches', 'matches', 'duration')
+
+
+admin.site.register(SavedSearch, SavedSearchAdmin)
+admin.site.register(AlertRun, AlertRunAdmin)
+
+
+class PopularQueryAdmin(admin.ModelAdmin):
+    list_display = ('rank', 'q', 'sources', 'categories', 'date', 'count', 'avg_latency_ms', 'cache_hit_ratio', 'empty_ratio')
+
+
+admin.site.register(PopularQuery, PopularQueryAdmin)
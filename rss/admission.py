@@ -0,0 +1,198 @@
+"""
+Admission control for the routes that query Elasticsearch
+
+A single crawler walking pages or filter combinations could otherwise keep
+every worker busy and saturate the cluster for everyone else. Requests to
+the routes listed in ADMISSION_ROUTES go through, in order:
+
+- request validation: page depth (`from`), number of filter values and
+  size of the `q` query (see rss/query_cost.py),
+- a token bucket per client and route, and a token bucket per route shared
+  by all clients, kept in the "admission" cache (global with a shared cache
+  backend, per worker with LocMemCache), apart from the pages and cards so
+  that busy listings never evict them,
+- a cap on in-flight Elasticsearch requests per process, enforced by
+  InstrumentedTransport through `es_slot()`.
+
+Rejected requests get a small pre-rendered 400/429/503 response, so that
+refusing work costs next to nothing. Page cache hits are served before
+admission control runs and are never limited.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from rss import instrumentation
+from rss import query_cost
+
+# Query parameters holding filter values, limited to ADMISSION_MAX_FILTER_VALUES
+FILTER_PARAMS = ("source", "category")
+CACHE_ALIAS = "admission"
+
+
+class Overloaded(Exception):
+    """No Elasticsearch slot became free within ES_QUEUE_TIMEOUT"""
+
+
+class TokenBucket:
+    """
+    Token bucket stored in the cache as `(tokens, updated_at)`. Updates are
+    not atomic: concurrent requests may both take the last token, which is
+    fine for rate limiting.
+    """
+
+    def __init__(self, key, rate, burst):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+
+    def take(self, now=None):
+        """Take a token; return 0 when allowed, else seconds until one is available"""
+        now = now or time.time()
+        cache = caches[CACHE_ALIAS]
+        tokens, updated_at = cache.get(self.key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        # Entries expire once the bucket would be full again anyway
+        timeout = int(self.burst / self.rate) + 1
+        cache.set(self.key, (tokens - 1, now), timeout)
+        return 0
+
+
+def client_id(request):
+    """Client address, taken from X-Forwarded-For behind NUM_PROXIES proxies"""
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if settings.NUM_PROXIES and forwarded:
+        addresses = [a.strip() for a in forwarded.split(",")]
+        return addresses[max(len(addresses) - settings.NUM_PROXIES, 0)]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def match_route(path):
+    """Longest ADMISSION_ROUTES prefix of `path`, or None"""
+    best = None
+    for prefix in settings.ADMISSION_ROUTES:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return best
+
+
+def validate(request):
+    """Reason to reject the request parameters, or None"""
+    offset = request.GET.get("from")
+    if offset is not None:
+        try:
+            offset = int(offset)
+        except ValueError:
+            return "invalid_from"
+        if offset < 0 or offset > settings.ADMISSION_MAX_FROM:
+            return "page_depth"
+    values = sum(len(request.GET.getlist(param)) for param in FILTER_PARAMS)
+    if values > settings.ADMISSION_MAX_FILTER_VALUES:
+        return "filter_cardinality"
+    q = request.GET.get("q", "")
+    if len(q) > settings.QUERY_MAX_LENGTH or query_cost.analyze(q).rejected():
+        return "query_cost"
+    return None
+
+
+@lru_cache(maxsize=None)
+def _body(status, as_json):
+    if as_json:
+        messages = {
+            400: "invalid or too expensive request",
+            429: "too many requests",
+            503: "overloaded, try again later",
+        }
+        return json.dumps({"error": messages[status]}), "application/json"
+    return render_to_string("rss/rejected.html", {"status": status}), "text/html"
+
+
+def rejection(request, status, reason, route, retry_after=None):
+    """Cheap response for a rejected request, its body is rendered once"""
+    instrumentation.registry.inc(
+        "junojobs_admission_rejected_total",
+        {"reason": reason, "route": route or "other"},
+        help="Requests rejected by admission control",
+    )
+    content, content_type = _body(status, request.path.startswith("/api/"))
+    response = HttpResponse(content, content_type=content_type, status=status)
+    if retry_after is not None:
+        response["Retry-After"] = str(max(int(retry_after + 0.999), 1))
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.ADMISSION_CONTROL:
+            return None
+        route = match_route(request.path)
+        if route is None:
+            return None
+
+        reason = validate(request)
+        if reason is not None:
+            return rejection(request, 400, reason, route)
+
+        client_rate, client_burst, route_rate, route_burst = settings.ADMISSION_ROUTES[route]
+        wait = TokenBucket(
+            "bucket:{}:{}".format(route, client_id(request)), client_rate, client_burst
+        ).take()
+        if wait:
+            return rejection(request, 429, "client_rate", route, wait)
+        wait = TokenBucket("bucket:{}".format(route), route_rate, route_burst).take()
+        if wait:
+            return rejection(request, 503, "route_rate", route, wait)
+        return None
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, Overloaded):
+            return rejection(
+                request, 503, "es_in_flight", match_route(request.path), settings.ES_QUEUE_TIMEOUT
+            )
+        return None
+
+
+class _Slots:
+    semaphore = None
+    lock = threading.Lock()
+
+
+def _semaphore():
+    if _Slots.semaphore is None:
+        with _Slots.lock:
+            if _Slots.semaphore is None:
+                _Slots.semaphore = threading.BoundedSemaphore(settings.ES_MAX_IN_FLIGHT)
+    return _Slots.semaphore
+
+
+@contextmanager
+def es_slot():
+    """Hold one of the ES_MAX_IN_FLIGHT Elasticsearch slots of this process"""
+    semaphore = _semaphore()
+    if not semaphore.acquire(blocking=False):
+        start = time.perf_counter()
+        acquired = semaphore.acquire(timeout=settings.ES_QUEUE_TIMEOUT)
+        instrumentation.record("queue", time.perf_counter() - start)
+        if not acquired:
+            raise Overloaded()
+    try:
+        yield
+    finally:
+        semaphore.release()
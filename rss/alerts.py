@@ -0,0 +1,275 @@
+"""
+Job alerts for saved searches
+
+New jobs are matched against every saved search once per ingest batch,
+instead of every user polling /search/. Saved searches are parsed with the
+SmartQueryParser once, saved searches with the same terms are grouped, and
+every group is indexed under a single "anchor" term, so a job only has to be
+checked against the groups anchored on one of its words:
+
+    matcher = AlertMatcher(SavedSearch.objects.all())
+    for saved_search_id, doc in matcher.match_batch(docs):
+        ...
+
+A job matches a saved search when it contains every recognized skill,
+location, seniority and general term of the query (in its title or body) and
+passes its source and category filters. This is stricter than the ranked
+/search/ query on purpose: an alert should only fire for jobs that really
+match.
+
+Saved searches only get alerts once their address is confirmed from the link
+sent by `send_confirmation()`.
+"""
+
+import logging
+import time
+from urllib.parse import quote
+
+from dateutil import parser as date_parser
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from elasticsearch_dsl import Search
+
+from rss.entities import tokenize
+from rss.models import AlertNotification, AlertRun, SavedSearch
+from rss.query_parser import parse_query
+
+logger = logging.getLogger(__name__)
+
+# Key for saved searches without any term, anchored on their filters instead
+NO_TERMS = ""
+
+
+class CompiledSearch:
+    __slots__ = ("id", "words", "phrases", "sources", "categories")
+
+    def __init__(self, saved_search):
+        params = parse_query(saved_search.query)
+        terms = set(params.skills | params.locations | params.seniority)
+        terms.update(params.general_terms)
+        self.id = saved_search.id
+        self.words = frozenset(t for t in terms if " " not in t)
+        self.phrases = tuple(sorted(t for t in terms if " " in t))
+        self.sources = frozenset(saved_search.source_list())
+        self.categories = frozenset(saved_search.category_list())
+
+    def anchor(self):
+        """Longest single word (likely the most selective), else first phrase word"""
+        if self.words:
+            return max(self.words, key=lambda w: (len(w), w))
+        if self.phrases:
+            return self.phrases[0].split()[0]
+        return NO_TERMS
+
+    def accepts(self, source, category):
+        if self.sources and source not in self.sources:
+            return False
+        return not self.categories or category in self.categories
+
+
+class _Group:
+    """Saved searches sharing the same terms, checked against a job only once"""
+    __slots__ = ("words", "phrases", "unfiltered", "filtered")
+
+    def __init__(self, words, phrases):
+        self.words = words
+        self.phrases = phrases
+        self.unfiltered = []  # ids of saved searches without source/category filters
+        self.filtered = []
+
+    def add(self, compiled):
+        if compiled.sources or compiled.categories:
+            self.filtered.append(compiled)
+        else:
+            self.unfiltered.append(compiled.id)
+
+    def matches(self, tokens, text):
+        if not self.words <= tokens:
+            return False
+        return all(phrase in text for phrase in self.phrases)
+
+
+class AlertMatcher:
+    def __init__(self, saved_searches):
+        self.by_anchor = {}
+        self.size = 0
+        groups = {}
+        for saved_search in saved_searches:
+            compiled = CompiledSearch(saved_search)
+            key = (compiled.words, compiled.phrases)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = _Group(*key)
+                self.by_anchor.setdefault(compiled.anchor(), []).append(group)
+            group.add(compiled)
+            self.size += 1
+
+    def match(self, doc):
+        """Ids of the saved searches matching a job document"""
+        text = " ".join(
+            (doc.get("title") or "", doc.get("body") or "")
+        ).lower()
+        tokens = tokenize(text)
+        source = doc.get("source")
+        category = doc.get("category")
+        matched = []
+        for groups in self._candidates(tokens):
+            for group in groups:
+                if group.matches(tokens, text):
+                    matched.extend(group.unfiltered)
+                    matched.extend(
+                        c.id for c in group.filtered if c.accepts(source, category)
+                    )
+        return matched
+
+    def match_batch(self, docs):
+        """Yield `(saved_search_id, doc)` for every match in a batch of jobs"""
+        for doc in docs:
+            for saved_search_id in self.match(doc):
+                yield saved_search_id, doc
+
+    def _candidates(self, tokens):
+        no_terms = self.by_anchor.get(NO_TERMS)
+        if no_terms:
+            yield no_terms
+        by_anchor = self.by_anchor
+        # Iterate over the smaller side of the intersection
+        if len(tokens) < len(by_anchor):
+            for token in tokens:
+                groups = by_anchor.get(token)
+                if groups:
+                    yield groups
+        else:
+            for anchor, groups in by_anchor.items():
+                if anchor in tokens:
+                    yield groups
+
+
+def _new_docs(checkpoint):
+    """Jobs ingested after `checkpoint`, scrolled in constant memory"""
+    query = Search(index="rss").source(["title", "body", "source", "category", "ingestedAt"])
+    # Leave a margin for documents that are indexed but not yet searchable
+    window = {"lte": "now-1m"}
+    if checkpoint is not None:
+        window["gt"] = checkpoint.isoformat()
+    else:
+        # First run: only look at the last day
+        window["gte"] = "now-1d"
+    query = query.filter("range", ingestedAt=window)
+    return query.params(size=settings.ALERTS_BATCH_SIZE).scan()
+
+
+def run_alerts():
+    """Match every job ingested since the last run against all saved searches"""
+    started = time.perf_counter()
+    last_run = AlertRun.objects.exclude(checkpoint=None).order_by("-started").first()
+    checkpoint = last_run.checkpoint if last_run else None
+    matcher = AlertMatcher(SavedSearch.objects.filter(confirmed=True).iterator())
+    run = AlertRun(checkpoint=checkpoint, saved_searches=matcher.size)
+
+    batch = []
+    for hit in _new_docs(checkpoint):
+        batch.append(hit)
+        if len(batch) >= settings.ALERTS_BATCH_SIZE:
+            _process_batch(matcher, batch, run)
+            batch = []
+    if batch:
+        _process_batch(matcher, batch, run)
+
+    run.duration = time.perf_counter() - started
+    run.save()
+    return run
+
+
+def _process_batch(matcher, hits, run):
+    docs = {}
+    for hit in hits:
+        doc = hit.to_dict()
+        docs[hit.meta.id] = doc
+        ingested = doc.get("ingestedAt")
+        if ingested:
+            ingested = date_parser.parse(ingested)
+            if run.checkpoint is None or ingested > run.checkpoint:
+                run.checkpoint = ingested
+
+    pairs = set()
+    for doc_id, doc in docs.items():
+        for saved_search_id in matcher.match(doc):
+            pairs.add((saved_search_id, doc_id))
+
+    # Re-runs over the same jobs must not queue the same alert twice
+    existing = set(
+        AlertNotification.objects.filter(doc_id__in=list(docs)).values_list(
+            "saved_search_id", "doc_id"
+        )
+    )
+    notifications = [
+        AlertNotification(
+            saved_search_id=saved_search_id,
+            doc_id=doc_id,
+            title=(docs[doc_id].get("title") or "")[:500],
+        )
+        for saved_search_id, doc_id in sorted(pairs - existing)
+    ]
+    AlertNotification.objects.bulk_create(notifications)
+    run.docs += len(docs)
+    run.matches += len(notifications)
+
+
+def send_confirmation(saved_search, base_url):
+    """Ask the address owner to confirm a new saved search"""
+    send_mail(
+        "Confirm your job alert on Juno Jobs",
+        "Confirm that you want an email when new jobs match \"{}\":\n{}/alerts/confirm/{}/\n\n"
+        "If you did not ask for this alert, ignore this email.".format(
+            saved_search.query, base_url, saved_search.token
+        ),
+        settings.DEFAULT_FROM_EMAIL,
+        [saved_search.email],
+    )
+
+
+def send_digests(base_url):
+    """Send one email per address with all its pending alerts"""
+    pending = (
+        AlertNotification.objects.filter(sent=False)
+        .select_related("saved_search")
+        .order_by("saved_search__email", "saved_search_id", "id")
+    )
+    digests = {}
+    for notification in pending:
+        digests.setdefault(notification.saved_search.email, []).append(notification)
+
+    sent = 0
+    for email, notifications in digests.items():
+        lines = []
+        current = None
+        for notification in notifications:
+            saved_search = notification.saved_search
+            if saved_search != current:
+                current = saved_search
+                lines.append("\nNew jobs for \"{}\":".format(saved_search.query))
+            lines.append(
+                "- {} {}/job/?id={}".format(
+                    notification.title, base_url, quote(notification.doc_id, safe="")
+                )
+            )
+        unsubscribe = {
+            "{}/alerts/unsubscribe/{}/".format(base_url, n.saved_search.token)
+            for n in notifications
+        }
+        lines.append("\nUnsubscribe: " + " ".join(sorted(unsubscribe)))
+        with transaction.atomic():
+            send_mail(
+                "New jobs on Juno Jobs",
+                "\n".join(lines).strip(),
+                settings.DEFAULT_FROM_EMAIL,
+                [email],
+            )
+            AlertNotification.objects.filter(
+                id__in=[n.id for n in notifications]
+            ).update(sent=True)
+        sent += 1
+    return sent
+
@@ -0,0 +1,244 @@
+"""
+Versioned JSON API for programmatic consumers
+
+Endpoints (mounted under /api/v1/):
+
+    search/?q=&source=&category=&date=&size=&cursor=
+    source/?q=<source name>&size=&cursor=
+    search/export/?q=&source=&category=&date=      (NDJSON, one job per line)
+
+Hits are projected to a few fields, without the job body. Pages are walked
+with an opaque `cursor` (the `search_after` values of the last hit) instead
+of `from`, so deep pages cost the same as the first one; only the first page
+carries the `total` number of matches. The export walks
+the whole result set through a point in time, one page at a time, so memory
+stays constant however many jobs match. Its first page is fetched before the
+response starts streaming, so that an overloaded or unreachable cluster is
+still answered with a 503; later pages wait for an Elasticsearch slot
+instead of cutting the export short.
+"""
+
+import base64
+import itertools
+import json
+import logging
+from urllib.parse import quote
+
+import elasticsearch
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+
+from rss.admission import Overloaded
+from rss.instrumentation import registry, timer
+from rss.page_cache import cache_page
+from rss.query_parser import build_filtered_query
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ["title", "link", "pubDate", "source", "category"]
+# pubDate first, then link to break ties, so that cursors are stable
+SORT = [
+    {"pubDate": {"order": "desc", "unmapped_type": "date"}},
+    {"link": {"order": "asc"}},
+]
+
+DEFAULT_SIZE = 20
+MAX_SIZE = 100
+EXPORT_PAGE_SIZE = 1000
+PIT_KEEP_ALIVE = "2m"
+
+
+class BadRequest(Exception):
+    pass
+
+
+def encode_cursor(sort_values):
+    raw = json.dumps(sort_values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise BadRequest("invalid cursor")
+    if not isinstance(values, list):
+        raise BadRequest("invalid cursor")
+    return values
+
+
+def _size(request):
+    try:
+        size = int(request.GET.get("size", DEFAULT_SIZE))
+    except ValueError:
+        raise BadRequest("size must be an integer")
+    return max(1, min(size, MAX_SIZE))
+
+
+def _search_query(request):
+    with timer("parse"):
+        return build_filtered_query(
+            request.GET.get("q", ""),
+            request.GET.getlist("source"),
+            request.GET.getlist("category"),
+            request.GET.get("date", ""),
+        )
+
+
+def _source_query(request):
+    return {"term": {"source": request.GET.get("q", "")}}
+
+
+def project(hit):
+    """Compact JSON representation of a search hit"""
+    source = hit.get("_source", {})
+    job = {"id": hit["_id"]}
+    for field in FIELDS:
+        job[field] = source.get(field)
+    job["url"] = "/job/?id={}".format(quote(hit["_id"], safe=""))
+    return job
+
+
+def _page(request, query):
+    """One page of hits for `query`, continuing after `cursor` if given"""
+    body = {
+        "size": _size(request),
+        "query": query,
+        "sort": SORT,
+        "_source": FIELDS,
+    }
+    if request.GET.get("cursor"):
+        body["search_after"] = decode_cursor(request.GET["cursor"])
+    else:
+        # Counting every match is only worth it for the first page
+        body["track_total_hits"] = True
+
+    res = Search(index="rss").update_from_dict(body).execute().to_dict()
+    hits = res["hits"]["hits"]
+    next_cursor = None
+    if len(hits) == body["size"]:
+        next_cursor = encode_cursor(hits[-1]["sort"])
+    return {
+        "total": res["hits"].get("total", {}).get("value"),
+        "hits": [project(hit) for hit in hits],
+        "next": next_cursor,
+    }
+
+
+def _count_error():
+    registry.inc(
+        "junojobs_search_errors_total",
+        {"kind": "api"},
+        help="Searches that failed in Elasticsearch",
+    )
+
+
+def _unavailable(request, err):
+    logger.warning("Elasticsearch unavailable for API query %r: %s", request.GET, err)
+    _count_error()
+    return JsonResponse({"error": "search unavailable"}, status=503)
+
+
+def _json_page(request, build_query):
+    try:
+        page = _page(request, build_query(request))
+        # Only counted on the first page
+        request._query_hits = page["total"]
+        return JsonResponse(page)
+    except BadRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except elasticsearch.RequestError as err:
+        logger.warning("Elasticsearch error for API query %r: %s", request.GET, err.info)
+        _count_error()
+        return JsonResponse({"error": "invalid query"}, status=400)
+    except elasticsearch.TransportError as err:
+        return _unavailable(request, err)
+
+
+@cache_page(settings.CACHE_TIME_SEARCH)
+def search(request):
+    return _json_page(request, _search_query)
+
+
+@cache_page(settings.CACHE_TIME_SEARCH)
+def source(request):
+    return _json_page(request, _source_query)
+
+
+def _open_pit(es):
+    """Point in time on the index, or None on clusters without PIT (< 7.10)"""
+    try:
+        return es.open_point_in_time(index="rss", keep_alive=PIT_KEEP_ALIVE)["id"]
+    except elasticsearch.TransportError:
+        logger.warning("Point in time not available, exporting without it")
+        return None
+
+
+def _search_page(es, body, pit_id):
+    if pit_id:
+        body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+        return es.search(body=body)
+    return es.search(index="rss", body=body)
+
+
+def _wait_for_page(es, body, pit_id):
+    """Next page of a scan, waiting as long as it takes for a free slot"""
+    while True:
+        try:
+            return _search_page(es, body, pit_id)
+        except Overloaded:
+            logger.info("Export waiting for an Elasticsearch slot")
+
+
+def scan_hits(query, page_size=EXPORT_PAGE_SIZE):
+    """Yield every hit of `query` in sort order, one page in memory at a time"""
+    es = connections.get_connection()
+    pit_id = _open_pit(es)
+    body = {"size": page_size, "query": query, "sort": SORT, "_source": FIELDS}
+    try:
+        res = _search_page(es, body, pit_id)
+        while True:
+            pit_id = res.get("pit_id", pit_id)
+            hits = res["hits"]["hits"]
+            yield from hits
+            if len(hits) < page_size:
+                return
+            body["search_after"] = hits[-1]["sort"]
+            res = _wait_for_page(es, body, pit_id)
+    finally:
+        if pit_id:
+            try:
+                es.close_point_in_time(body={"id": pit_id})
+            except (elasticsearch.TransportError, Overloaded):
+                logger.warning("Could not close point in time", exc_info=True)
+
+
+def _ndjson(hits):
+    exported = 0
+    for hit in hits:
+        exported += 1
+        yield json.dumps(project(hit)) + "\n"
+    registry.inc(
+        "junojobs_api_exported_jobs_total",
+        value=exported,
+        help="Jobs streamed by the NDJSON export",
+    )
+
+
+def export(request):
+    """Every matching job as NDJSON, streamed in constant memory"""
+    hits = scan_hits(_search_query(request))
+    # Fetched now, while Overloaded still turns into a 503 in admission control
+    try:
+        first = list(itertools.islice(hits, 1))
+    except elasticsearch.TransportError as err:
+        return _unavailable(request, err)
+    response = StreamingHttpResponse(
+        _ndjson(itertools.chain(first, hits)),
+        content_type="application/x-ndjson",
+    )
+    response["Content-Disposition"] = 'attachment; filename="jobs.ndjson"'
+    return response
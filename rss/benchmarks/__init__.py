@@ -0,0 +1,5 @@
+"""
+Benchmark suite for the search stack
+
+Run with `python manage.py bench`. See rss/management/commands/bench.py.
+"""
@@ -0,0 +1,72 @@
+"""
+Synthetic job corpus for benchmarks
+
+Documents have the same shape as the ones written by node/ingest.js, and are
+generated from a fixed seed so that results are comparable across commits.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+from rss.entities import extract_from_doc
+from rss.query_parser import SmartQueryParser
+from rss.sources import sources
+
+ROLES = ["Developer", "Engineer", "Architect", "Designer", "Data Scientist", "SRE"]
+
+FILLER = (
+    "We are a fast growing team building tools used by thousands of customers. "
+    "You will work closely with product and design to ship features end to end. "
+    "We offer a competitive salary, flexible hours and a generous learning budget. "
+).split()
+
+# Sample queries exercising every branch of SmartQueryParser
+QUERIES = [
+    "senior python developer remote",
+    "react native bangalore",
+    "machine learning engineer new york",
+    "entry level javascript jobs in london",
+    "golang kubernetes",
+    "rust",
+    "product designer",
+    '"Ruby on Rails" OR "Rails"',
+    "staff engineer work from home",
+    "devops aws terraform berlin",
+]
+
+
+def generate_corpus(size=2000, seed=42, now=None):
+    """Return a list of `(doc_id, doc)` tuples"""
+    rng = random.Random(seed)
+    now = now or datetime(2026, 1, 1, tzinfo=timezone.utc)
+    skills = sorted(SmartQueryParser.SKILLS)
+    locations = sorted(SmartQueryParser.LOCATION_KEYWORDS)
+    seniority = sorted(SmartQueryParser.SENIORITY_LEVELS)
+
+    corpus = []
+    for i in range(size):
+        source = sources[i % len(sources)]
+        skill = rng.choice(skills)
+        title = "{} {} {}".format(
+            rng.choice(seniority).title(), skill.title(), rng.choice(ROLES)
+        )
+        words = [rng.choice(FILLER) for _ in range(rng.randint(60, 240))]
+        words[rng.randrange(len(words))] = rng.choice(skills)
+        words[rng.randrange(len(words))] = rng.choice(locations)
+        body = " ".join(words) + " Apply at https://example.com/apply/{}".format(i)
+        link = "https://example.com/jobs/{}".format(i)
+        pub_date = now - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+        doc = {
+            "title": title,
+            "link": link,
+            "body": body,
+            "body_html": "<p>" + body + "</p>",
+            "pubDate": pub_date.isoformat(),
+            "source": source.name,
+            "category": source.category,
+        }
+        doc.update(extract_from_doc(doc))
+        corpus.append((link, doc))
+
+    corpus.sort(key=lambda item: item[1]["pubDate"], reverse=True)
+    return corpus
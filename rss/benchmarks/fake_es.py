@@ -0,0 +1,232 @@
+"""
+In-process Elasticsearch stand-in for benchmarks
+
+`FakeConnection` answers requests from recorded responses when a recording
+matches, and otherwise evaluates a small subset of the query DSL (the parts
+used by rss.views) against a synthetic corpus. `RecordingConnection` talks
+to a real cluster and saves every response so that it can be replayed later.
+
+Usage:
+    FakeConnection.load(generate_corpus(), recordings_path)
+    connections.create_connection(hosts=["fake"], connection_class=FakeConnection)
+"""
+
+import hashlib
+import json
+import time
+from urllib.parse import unquote
+
+from elasticsearch import Connection, Urllib3HttpConnection
+
+
+def request_key(method, url, body):
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True)
+        except ValueError:
+            pass
+    raw = "{} {} {}".format(method, url.split("?")[0], body or "")
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class RecordingConnection(Urllib3HttpConnection):
+    """Real connection that keeps every response for later replay"""
+
+    recordings = {}
+
+    def perform_request(self, method, url, params=None, body=None, **kwargs):
+        status, headers, data = super().perform_request(
+            method, url, params=params, body=body, **kwargs
+        )
+        self.recordings[request_key(method, url, body)] = [status, data]
+        return status, headers, data
+
+    @classmethod
+    def save(cls, path):
+        with open(path, "w") as f:
+            json.dump(cls.recordings, f)
+
+
+class FakeConnection(Connection):
+    docs = []
+    by_id = {}
+    recordings = {}
+    # Simulated network + server latency per request, in seconds
+    latency = 0.0
+
+    @classmethod
+    def load(cls, corpus, recordings_path=None, latency=0.0):
+        # Sorted like the API (pubDate desc, then link asc) for search_after
+        cls.docs = sorted(corpus, key=lambda item: item[0])
+        cls.docs.sort(key=lambda item: item[1]["pubDate"], reverse=True)
+        cls.by_id = dict(corpus)
+        cls.latency = latency
+        cls.recordings = {}
+        if recordings_path:
+            with open(recordings_path) as f:
+                cls.recordings = json.load(f)
+
+    def perform_request(
+        self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None
+    ):
+        if self.latency:
+            time.sleep(self.latency)
+
+        recorded = self.recordings.get(request_key(method, url, body))
+        if recorded is not None:
+            status, data = recorded
+        else:
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            status, data = self._handle(method, url.split("?")[0], body)
+            data = json.dumps(data)
+
+        if status >= 300 and status not in ignore:
+            self._raise_error(status, data)
+        return status, {}, data
+
+    def _handle(self, method, path, body):
+        parts = [p for p in path.split("/") if p]
+        if method == "HEAD" or (method == "PUT" and len(parts) == 1):
+            return 200, {}
+        if not parts:
+            return 200, {"version": {"number": "7.14.0"}, "tagline": "You Know, for Search"}
+
+        endpoint = parts[-1] if parts[-1].startswith("_") else None
+        if len(parts) >= 3 and parts[-2] == "_doc":
+            endpoint = "_doc"
+
+        if endpoint == "_search":
+            return 200, self.search(json.loads(body) if body else {})
+        if endpoint == "_pit":
+            return 200, {"id": "fake-pit"} if method == "POST" else {"succeeded": True}
+        if endpoint == "_msearch":
+            return 200, self.msearch(body)
+        if endpoint == "_count":
+            query = (json.loads(body) if body else {}).get("query")
+            return 200, {"count": len(self._filter(query))}
+        if endpoint == "_mget":
+            ids = json.loads(body).get("ids", [])
+            return 200, {"docs": [self._get(doc_id) for doc_id in ids]}
+        if endpoint == "_doc":
+            doc = self._get(unquote(parts[-1]))
+            return (200 if doc["found"] else 404), doc
+        return 404, {"error": "unsupported fake request {} {}".format(method, path)}
+
+    def search(self, body):
+        matched = self._filter(body.get("query"))
+        if body.get("search_after"):
+            after = tuple(body["search_after"][:2])
+            matched = [
+                (i, d) for i, d in matched
+                if d["pubDate"] < after[0] or (d["pubDate"] == after[0] and i > after[1])
+            ]
+        start = body.get("from", 0)
+        size = body.get("size", 10)
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": len(matched), "relation": "eq"},
+                "max_score": None,
+                "hits": [
+                    self._hit(doc_id, doc) for doc_id, doc in matched[start:start + size]
+                ],
+            },
+        }
+        if body.get("aggs"):
+            response["aggregations"] = {
+                name: _aggregate(spec, matched) for name, spec in body["aggs"].items()
+            }
+        return response
+
+    def msearch(self, body):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        return {"responses": [self.search(b) for b in lines[1::2]]}
+
+    def _get(self, doc_id):
+        doc = self.by_id.get(doc_id)
+        if doc is None:
+            return {"_index": "rss", "_id": doc_id, "found": False}
+        return dict(self._hit(doc_id, doc), found=True)
+
+    def _hit(self, doc_id, doc):
+        return {
+            "_index": "rss",
+            "_type": "_doc",
+            "_id": doc_id,
+            "_score": None,
+            "_source": doc,
+            "sort": [doc["pubDate"], doc_id],
+        }
+
+    def _filter(self, query):
+        return [(i, d) for i, d in self.docs if _matches(query, i, d)]
+
+
+def _matches(query, doc_id, doc):
+    """Evaluate the subset of the query DSL used by the views"""
+    if not query:
+        return True
+    kind, spec = next(iter(query.items()))
+    if kind == "bool":
+        for clause in ("must", "filter"):
+            clauses = spec.get(clause, [])
+            if isinstance(clauses, dict):
+                clauses = [clauses]
+            if not all(_matches(c, doc_id, doc) for c in clauses):
+                return False
+        return True
+    if kind in ("match", "match_phrase", "term"):
+        field, value = next(iter(spec.items()))
+        if isinstance(value, dict):
+            value = value.get("query", value.get("value"))
+        if field == "_id":
+            return doc_id == value
+        return doc.get(field) == value
+    if kind == "terms":
+        field, values = next(iter(spec.items()))
+        value = doc.get(field)
+        if isinstance(value, list):
+            # Keyword arrays (skills, locations, seniority)
+            return any(v in values for v in value)
+        return value in values
+    if kind == "ids":
+        return doc_id in spec.get("values", [])
+    if kind == "more_like_this":
+        return all(like.get("_id") != doc_id for like in spec.get("like", []))
+    if kind == "range":
+        field, bounds = next(iter(spec.items()))
+        gte = bounds.get("gte")
+        if gte and not gte.startswith("now"):
+            return (doc.get(field) or "") >= gte
+        return True
+    # Full-text queries: every document matches
+    return True
+
+
+def _aggregate(spec, docs):
+    """Evaluate `terms` (with nested sub-aggregations) and `max` aggregations"""
+    if "terms" in spec:
+        field = spec["terms"]["field"]
+        groups = {}
+        for doc_id, doc in docs:
+            if doc.get(field) is not None:
+                groups.setdefault(doc[field], []).append((doc_id, doc))
+        buckets = []
+        for key, group in sorted(groups.items(), key=lambda g: -len(g[1])):
+            bucket = {"key": key, "doc_count": len(group)}
+            for name, sub in spec.get("aggs", {}).items():
+                bucket[name] = _aggregate(sub, group)
+            buckets.append(bucket)
+        return {"buckets": buckets[: spec["terms"].get("size", 10)]}
+    if "max" in spec:
+        values = [doc.get(spec["max"]["field"]) for _, doc in docs]
+        values = [v for v in values if v is not None]
+        if not values:
+            return {"value": None}
+        return {"value": 1, "value_as_string": max(values)}
+    return {}
@@ -0,0 +1,198 @@
+"""
+Micro, end-to-end and job alert benchmarks for the search stack
+
+Every benchmark is a `(name, fn, setup)` triple: `setup` (optional) runs
+untimed before each iteration and its return value is passed to `fn`.
+"""
+
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.test import Client
+from elasticsearch_dsl.utils import AttrDict
+
+from rss.benchmarks.corpus import QUERIES
+from rss.entities import extract_from_doc
+from rss.postproc import postproc
+from rss.query_cost import analyze
+from rss.query_parser import SmartQueryParser, build_search_query
+from rss.querylog import QueryStats
+from rss.sources import sources
+from rss.templates.rss.linkurls import linkurls
+
+MICRO = "micro"
+REQUEST = "request"
+ALERTS = "alerts"
+
+# Number of saved searches the alert matcher is benchmarked with
+ALERT_SIZES = (1000, 10000, 100000)
+
+
+def micro_benchmarks(corpus):
+    from rss.views import _convert_dates
+
+    parser = SmartQueryParser()
+    page = [doc for _, doc in corpus[:40]]
+    long_body = " ".join(doc["body"] for doc in page[:5])
+    rng = random.Random(42)
+    query_records = [
+        {"q": rng.choice(QUERIES), "latency_ms": 40.0, "hits": 10, "cache_hit": False}
+        for _ in range(1000)
+    ]
+    postproc_doc = dict(page[0], source="RemoteOk")
+
+    return [
+        ("parse", lambda _: [parser.parse(q) for q in QUERIES], None),
+        ("build_search_query", lambda _: [build_search_query(q) for q in QUERIES], None),
+        # Uncached, as for queries seen for the first time
+        ("query_cost", lambda _: [analyze.__wrapped__(q) for q in QUERIES], None),
+        (
+            "convert_dates",
+            _convert_dates,
+            lambda: [dict(doc) for doc in page],
+        ),
+        ("postproc", postproc, lambda: AttrDict(dict(postproc_doc))),
+        ("linkurls", lambda _: linkurls(long_body), None),
+        ("extract_entities", lambda _: [extract_from_doc(doc) for doc in page], None),
+        (
+            "query_stats_1k",
+            lambda stats: [stats.add(r) for r in query_records],
+            lambda: QueryStats(100),
+        ),
+    ]
+
+
+def saved_searches(count, seed=42):
+    """Unsaved SavedSearch objects with 1-3 vocabulary terms and some filters"""
+    from rss.models import SavedSearch
+
+    rng = random.Random(seed)
+    skills = sorted(SmartQueryParser.SKILLS)
+    locations = sorted(SmartQueryParser.LOCATION_KEYWORDS)
+    seniority = sorted(SmartQueryParser.SENIORITY_LEVELS)
+    names = sorted({source.name for source in sources})
+
+    result = []
+    for i in range(count):
+        words = [rng.choice(skills)]
+        if rng.random() < 0.4:
+            words.append(rng.choice(locations))
+        if rng.random() < 0.3:
+            words.insert(0, rng.choice(seniority))
+        result.append(
+            SavedSearch(
+                id=i + 1,
+                email="user{}@example.com".format(i),
+                query=" ".join(words),
+                sources=rng.choice(names) if rng.random() < 0.2 else "",
+            )
+        )
+    return result
+
+
+def alert_benchmarks(corpus, sizes=ALERT_SIZES):
+    """Match one ingest batch against growing numbers of saved searches"""
+    from rss.alerts import AlertMatcher
+
+    batch = [doc for _, doc in corpus[:500]]
+    benchmarks = []
+    for size in sizes:
+        matcher = AlertMatcher(saved_searches(size))
+        benchmarks.append(
+            (
+                "match_batch_{}".format(size),
+                lambda _, matcher=matcher: sum(1 for _ in matcher.match_batch(batch)),
+                None,
+            )
+        )
+    return benchmarks
+
+
+def request_benchmarks(doc_id, source):
+    # Like a browser, so that cache hits are served pre-compressed
+    client = Client(HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+    urls = {
+        "landing": "/",
+        "jobs": "/jobs/",
+        "search": "/search/?" + urlencode({"q": QUERIES[0]}),
+        "search_filtered": "/search/?"
+        + urlencode([("q", QUERIES[1]), ("source", source), ("date", "7d")]),
+        "source": "/source/?" + urlencode({"q": source}),
+        "job": "/job/?" + urlencode({"id": doc_id}),
+        "related": "/related/?" + urlencode({"id": doc_id}),
+        "api_search": "/api/v1/search/?" + urlencode({"q": QUERIES[0]}),
+        "sitemap": "/sitemap.xml",
+    }
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        return response
+
+    return [(name, lambda _, url=url: get(url), None) for name, url in urls.items()]
+
+
+def run(benchmarks, kind, iterations, warmup=3, select=None):
+    results = {}
+    for name, fn, setup in benchmarks:
+        if select and not any(s in name for s in select):
+            continue
+        for _ in range(warmup):
+            fn(setup() if setup else None)
+        timings = []
+        for _ in range(iterations):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg)
+            timings.append(time.perf_counter() - start)
+        results["{}.{}".format(kind, name)] = summarize(timings)
+    return results
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "iterations": len(timings),
+        "min_ms": timings[0] * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+    }
+
+
+def metadata(**extra):
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        date=datetime.now(timezone.utc).isoformat(),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        **extra
+    )
+
+
+def compare(current, baseline, threshold=0.05):
+    """Yield `(name, baseline_ms, current_ms, change, verdict)` for common benchmarks"""
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        old = baseline[name]["median_ms"]
+        new = current[name]["median_ms"]
+        change = (new - old) / old if old else 0.0
+        if abs(change) < threshold:
+            verdict = "~"
+        elif change < 0:
+            verdict = "faster"
+        else:
+            verdict = "slower"
+        yield name, old, new, change, verdict
@@ -1,8 +1,9 @@
 from dj import settings
+from rss.querylog import popular_searches
 
 
 def template_settings(request):
     return {
         'ANALYTICS': getattr(settings, 'ANALYTICS', ''),
-        'POPULAR': getattr(settings, 'POPULAR', [])
+        'POPULAR': popular_searches,
     }
@@ -0,0 +1,127 @@
+"""
+Entity vocabularies shared by the query parser and the ingest
+
+node/vocabulary.json lists the skills, locations and seniority levels that
+SmartQueryParser recognizes in queries. node/ingest.js tags every job with
+the entries found in its title and body (node/entities.js), in the `skills`,
+`locations` and `seniority` keyword fields, so that with ENTITY_FILTERS on
+recognized entities are searched with cached `terms` filters instead of
+full-text queries:
+
+    extract("Senior Python/Django developer, remote")
+    # {"skills": ["django", "python"], "locations": ["remote"], "seniority": ["senior"]}
+
+`extract()` must stay in step with node/entities.js. Jobs indexed before a
+vocabulary change are tagged again by `python manage.py tag_entities`.
+"""
+
+import json
+import logging
+import os
+import re
+
+from django.conf import settings
+from elasticsearch import helpers
+
+from rss.progress import Progress
+
+logger = logging.getLogger(__name__)
+
+VOCABULARY_PATH = os.path.join(settings.BASE_DIR, "node", "vocabulary.json")
+FIELDS = ("skills", "locations", "seniority")
+MAPPING = {"properties": {field: {"type": "keyword"} for field in FIELDS}}
+
+# Same pattern as node/entities.js
+_token_re = re.compile(r"[a-z0-9+#./-]+")
+_edges = "./-"
+
+
+def load_vocabulary(path=VOCABULARY_PATH):
+    """`{field: (entry, ...)}`, entries in the file order"""
+    with open(path) as f:
+        data = json.load(f)
+    return {field: tuple(data[field]) for field in FIELDS}
+
+
+VOCABULARY = load_vocabulary()
+
+# entry -> field, for one-word entries and entries of several words
+_words = {}
+_phrases = {}
+for _field in FIELDS:
+    for _entry in VOCABULARY[_field]:
+        (_phrases if " " in _entry else _words).setdefault(_entry, _field)
+_longest_phrase = max((len(p.split()) for p in _phrases), default=1)
+
+
+def tokenize(text):
+    """
+    Words of `text` as extract() sees them: every token as written, without
+    its edge punctuation and split on "/"
+
+        tokenize("Python/Django, .NET")  # {"python/django", "python", "django", ".net", "net"}
+    """
+    words = set()
+    for token in _token_re.findall(text.lower()):
+        word = token.strip(_edges)
+        words.update((token, word, *word.split("/")))
+    words.discard("")
+    return words
+
+
+def extract(text):
+    """`{field: [entry, ...]}` of the vocabulary entries found in `text`"""
+    found = {field: set() for field in FIELDS}
+    words = []
+    for token in _token_re.findall(text.lower()):
+        word = token.strip(_edges)
+        words.append(word)
+        # ".net" and "ci/cd" as written, "python." and "python/django" by parts
+        if token in _words:
+            found[_words[token]].add(token)
+        elif word in _words:
+            found[_words[word]].add(word)
+        else:
+            for part in word.split("/"):
+                if part in _words:
+                    found[_words[part]].add(part)
+
+    for size in range(2, _longest_phrase + 1):
+        for i in range(len(words) - size + 1):
+            phrase = " ".join(words[i : i + size])
+            if phrase in _phrases:
+                found[_phrases[phrase]].add(phrase)
+
+    return {field: sorted(values) for field, values in found.items()}
+
+
+def extract_from_doc(doc):
+    return extract("{} {}".format(doc.get("title") or "", doc.get("body") or ""))
+
+
+def tag_index(es, index="rss", chunk_size=500, progress=None):
+    """Tag every job of `index`, only updating those whose tags changed; returns the number updated"""
+    progress = progress or Progress()
+    es.indices.put_mapping(index=index, body=MAPPING)
+    updated = 0
+
+    def actions():
+        for hit in helpers.scan(
+            es, index=index, size=chunk_size, _source=["title", "body", *FIELDS]
+        ):
+            source = hit["_source"]
+            tags = extract_from_doc(source)
+            progress.add(1)
+            if all(source.get(field) == tags[field] for field in FIELDS):
+                continue
+            yield {"_op_type": "update", "_index": hit["_index"], "_id": hit["_id"], "doc": tags}
+
+    for ok, item in helpers.streaming_bulk(
+        es, actions(), chunk_size=chunk_size, max_retries=3, raise_on_error=False
+    ):
+        if ok:
+            updated += 1
+        else:
+            progress.add(0, errors=1)
+            logger.warning("Could not tag job: %s", item)
+    return updated
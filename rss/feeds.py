@@ -0,0 +1,224 @@
+"""
+RSS and Atom feeds for any search or source
+
+    /search/feed/?q=&source=&category=&date=     RSS 2.0 (/search/feed/atom/ for Atom)
+    /source/feed/?q=<source name>                RSS 2.0 (/source/feed/atom/ for Atom)
+
+Feed readers poll, so the generated XML is cached, compressed (see
+rss/page_cache.py), per normalized query and index generation (see
+rss/generation.py), and every response carries an `ETag`, a
+`Last-Modified` date and a `ttl` / `max-age` lasting until the next
+scheduled ingest. Readers polling in between get a 304 without any
+Elasticsearch query or rendering.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from dateutil import parser as date_parser
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.html import strip_tags
+from django.utils.text import Truncator, slugify
+from django.views.decorators.http import condition
+from elasticsearch_dsl import Search
+
+from rss import generation
+from rss.middleware import no_page_cache
+from rss.page_cache import CompressedPage, record_write
+from rss.query_parser import DATE_RANGES, build_filtered_query
+
+FEED_SIZE = 50
+
+
+class FeedParams:
+    """Normalized feed parameters, equal for equivalent query strings"""
+
+    def __init__(self, kind, q, sources=(), categories=(), date=""):
+        self.kind = kind
+        self.q = " ".join(q.split())[:100]
+        self.sources = tuple(sorted(set(sources)))
+        self.categories = tuple(sorted(set(categories)))
+        self.date = date if date in DATE_RANGES else ""
+
+    @classmethod
+    def from_request(cls, request, kind):
+        if kind == "source":
+            return cls(kind, request.GET.get("q", ""))
+        return cls(
+            kind,
+            request.GET.get("q", ""),
+            request.GET.getlist("source"),
+            request.GET.getlist("category"),
+            request.GET.get("date", ""),
+        )
+
+    def key(self):
+        # `q` keeps its case: query operators (OR, AND) and source names are
+        # case-sensitive, and the feed title is built from it
+        raw = repr((self.kind, self.q, self.sources, self.categories, self.date))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def query_string(self):
+        params = [("q", self.q)] + [("source", s) for s in self.sources]
+        params += [("category", c) for c in self.categories]
+        if self.date:
+            params.append(("date", self.date))
+        return urlencode(params)
+
+
+def seconds_until_next_ingest(now=None):
+    """Time left until the next scheduled ingest, plus the time it takes"""
+    now = now or datetime.now(timezone.utc)
+    interval = settings.INGEST_INTERVAL_MINUTES * 60
+    offset = settings.INGEST_OFFSET_MINUTES * 60
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    since_midnight = (now - midnight).total_seconds()
+    remaining = interval - (since_midnight - offset) % interval
+    return int(remaining) + settings.INGEST_DURATION_MINUTES * 60
+
+
+class SearchFeed(Feed):
+    kind = "search"
+
+    def get_object(self, request, *args, **kwargs):
+        params = FeedParams.from_request(request, self.kind)
+        params.feed_url = "{}?{}".format(request.path, params.query_string())
+        return params
+
+    def feed_url(self, params):
+        return params.feed_url
+
+    def title(self, params):
+        if params.q:
+            return "Juno Jobs - {} jobs".format(params.q)
+        return "Juno Jobs - latest jobs"
+
+    def link(self, params):
+        return "/search/?" + params.query_string()
+
+    def description(self, params):
+        return "New job postings matching \"{}\" on Juno Jobs".format(params.q)
+
+    def ttl(self, params):
+        return max(seconds_until_next_ingest() // 60, 1)
+
+    def query(self, params):
+        return build_filtered_query(params.q, params.sources, params.categories, params.date)
+
+    def items(self, params):
+        query = Search(index="rss").update_from_dict(
+            {
+                "size": FEED_SIZE,
+                "query": self.query(params),
+                "sort": [{"pubDate": {"order": "desc", "unmapped_type": "date"}}],
+                "_source": ["title", "body", "pubDate", "source", "category"],
+            }
+        )
+        return query.execute().hits
+
+    def item_title(self, hit):
+        return hit.title
+
+    def item_description(self, hit):
+        return Truncator(strip_tags(getattr(hit, "body", "") or "")).chars(500)
+
+    def item_link(self, hit):
+        return "/job/{}/?{}".format(slugify(hit.title), urlencode({"id": hit.meta.id}))
+
+    def item_guid(self, hit):
+        return hit.meta.id
+
+    item_guid_is_permalink = False
+
+    def item_pubdate(self, hit):
+        pub_date = getattr(hit, "pubDate", None)
+        return date_parser.parse(pub_date) if pub_date else None
+
+    def item_categories(self, hit):
+        return [c for c in (getattr(hit, "source", None), getattr(hit, "category", None)) if c]
+
+
+class AtomSearchFeed(SearchFeed):
+    feed_type = Atom1Feed
+    subtitle = SearchFeed.description
+
+
+class SourceFeed(SearchFeed):
+    kind = "source"
+
+    def title(self, params):
+        return "Juno Jobs - {} jobs".format(params.q)
+
+    def link(self, params):
+        return "/source/?" + params.query_string()
+
+    def description(self, params):
+        return "New job postings from {} on Juno Jobs".format(params.q)
+
+    def query(self, params):
+        return {"match_phrase": {"source": params.q}}
+
+
+class AtomSourceFeed(SourceFeed):
+    feed_type = Atom1Feed
+    subtitle = SourceFeed.description
+
+
+def _scope(params):
+    """Generation scope of a feed: its source, or the whole index"""
+    return params.q if params.kind == "source" else None
+
+
+def cached_feed(feed_class):
+    """
+    Serve a feed from the cache, keyed by its normalized parameters and the
+    index generation, answering conditional requests before anything else
+    """
+    feed = feed_class()
+    kind = feed_class.kind
+
+    def etag(request, *args, **kwargs):
+        current = generation.current()
+        if current is None:
+            return None
+        params = FeedParams.from_request(request, kind)
+        return '"{}-{}-{}"'.format(
+            current.token(_scope(params)), params.key(), feed_class.feed_type.__name__
+        )
+
+    def last_modified(request, *args, **kwargs):
+        current = generation.current()
+        if current is None:
+            return None
+        return current.last_modified(_scope(FeedParams.from_request(request, kind)))
+
+    @condition(etag_func=etag, last_modified_func=last_modified)
+    @no_page_cache
+    def view(request, *args, **kwargs):
+        tag = etag(request)
+        # Item links are absolute, so the host is part of the key
+        key = "feed:{}:{}".format(request.get_host(), tag) if tag else None
+        page = cache.get(key) if key else None
+        if page is None:
+            response = feed(request)
+            page = CompressedPage.from_response(response)
+            if key:
+                cache.set(key, page, settings.CACHE_TIME_FEED)
+                record_write(len(response.content), page)
+        response = page.to_response(request)
+        patch_cache_control(response, public=True, max_age=seconds_until_next_ingest())
+        return response
+
+    view.__name__ = view.__qualname__ = feed_class.__name__
+    return view
+
+
+search_feed = cached_feed(SearchFeed)
+search_feed_atom = cached_feed(AtomSearchFeed)
+source_feed = cached_feed(SourceFeed)
+source_feed_atom = cached_feed(AtomSourceFeed)
@@ -0,0 +1,102 @@
+"""
+Per-document job card fragments
+
+Listing pages (search, source, homepage) are assembled from job cards that
+are rendered once per `(document, card template version)` and kept in the
+cache, so cache memory grows with the number of documents instead of the
+number of distinct listing URLs. Cards live in the "cards" cache, sized for
+a few listings' worth of documents apart from the pages and search results.
+
+The only per-request value inside a card is the search query carried over
+to the job page; cards are rendered with a placeholder which is substituted
+after the cache lookup.
+
+Usage:
+    cards = render_cards(res.hits, SEARCH_CARD, q, prepare=_convert_dates)
+    cards = cached_cards(doc_ids, SEARCH_CARD, q)  # None if any card expired
+"""
+
+import hashlib
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from rss.instrumentation import registry, timer
+
+SEARCH_CARD = "rss/cards/search_card.html"
+SOURCE_CARD = "rss/cards/source_card.html"
+HOMEPAGE_ITEM = "rss/cards/homepage_item.html"
+
+QUERY_PLACEHOLDER = "__JUNO_QUERY__"
+CACHE_ALIAS = "cards"
+
+
+@lru_cache(maxsize=None)
+def template_version(template_name):
+    """Short hash of the card template source, changes on every edit/deploy"""
+    source = get_template(template_name).template.source
+    return hashlib.md5((template_name + source).encode("utf-8")).hexdigest()[:10]
+
+
+def card_key(template_name, doc_id):
+    doc_hash = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()
+    return "card:{}:{}".format(template_version(template_name), doc_hash)
+
+
+def render_cards(hits, template_name, q="", prepare=None):
+    """
+    Return the rendered card of every hit, in order. Cards missing from the
+    cache are rendered after calling `prepare(missing_hits)` on them.
+    """
+    hits = list(hits)
+    if not hits:
+        return []
+
+    with timer("cards"):
+        keys = [card_key(template_name, hit.meta.id) for hit in hits]
+        cache = caches[CACHE_ALIAS]
+        cached = cache.get_many(keys)
+        missing = [(key, hit) for key, hit in zip(keys, hits) if key not in cached]
+
+        if missing:
+            if prepare is not None:
+                prepare([hit for _, hit in missing])
+            template = get_template(template_name)
+            rendered = {
+                key: template.render({"hit": hit, "q": QUERY_PLACEHOLDER})
+                for key, hit in missing
+            }
+            cache.set_many(rendered, settings.CACHE_TIME_CARD)
+            cached.update(rendered)
+
+        registry.inc(
+            "junojobs_card_cache_total",
+            {"result": "hit"},
+            value=len(hits) - len(missing),
+            help="Job card fragment cache lookups",
+        )
+        registry.inc("junojobs_card_cache_total", {"result": "miss"}, value=len(missing))
+
+        return _with_query([cached[key] for key in keys], q)
+
+
+def cached_cards(doc_ids, template_name, q=""):
+    """The cards of `doc_ids` if they are all in the cache, else None"""
+    if not doc_ids:
+        return []
+    with timer("cards"):
+        keys = [card_key(template_name, doc_id) for doc_id in doc_ids]
+        cached = caches[CACHE_ALIAS].get_many(keys)
+        if len(cached) < len(keys):
+            return None
+        return _with_query([cached[key] for key in keys], q)
+
+
+def _with_query(cards, q):
+    query = escape(quote(q or "", safe="/"))
+    return [mark_safe(card.replace(QUERY_PLACEHOLDER, query)) for card in cards]
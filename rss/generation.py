@@ -0,0 +1,130 @@
+"""
+Index generation for conditional HTTP responses
+
+The generation of the `rss` index is derived from the document count and the
+newest `pubDate` of every source, read with one aggregation and kept in the
+cache for INDEX_GENERATION_TTL seconds, so an ingest is picked up by every
+process within that time.
+
+Views use it through Django's `condition` decorator, so `If-None-Match` and
+`If-Modified-Since` are answered with a 304 before any Elasticsearch query or
+template rendering:
+
+    @condition(etag_func=index_etag, last_modified_func=index_last_modified)
+    def index(request): ...
+"""
+
+import hashlib
+import logging
+
+from dateutil import parser as date_parser
+from django.conf import settings
+from django.core.cache import cache
+from elasticsearch_dsl import Search
+
+from rss.admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "index-generation"
+
+
+class Generation:
+    """Per-source `(doc_count, newest pubDate)` snapshot of the index"""
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    def token(self, source=None):
+        if source is None:
+            state = sorted(
+                (name, count, newest.isoformat() if newest else "")
+                for name, (count, newest) in self.sources.items()
+            )
+        else:
+            count, newest = self.sources.get(source, (0, None))
+            state = (source, count, newest.isoformat() if newest else "")
+        raw = "{}:{}".format(settings.RELEASE, state)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def last_modified(self, source=None):
+        if source is not None:
+            return self.sources.get(source, (0, None))[1]
+        dates = [newest for _, newest in self.sources.values() if newest]
+        return max(dates) if dates else None
+
+
+def fetch_source_counts():
+    """`{source: (doc_count, newest pubDate)}` for every source in the index"""
+    query = Search(index="rss").update_from_dict(
+        {
+            "size": 0,
+            "aggs": {
+                "sources": {
+                    "terms": {"field": "source", "size": 1000},
+                    "aggs": {"newest": {"max": {"field": "pubDate"}}},
+                }
+            },
+        }
+    )
+    res = query.execute()
+    sources = {}
+    for bucket in res.aggregations.sources.buckets:
+        newest = bucket.newest.value_as_string if bucket.newest.value else None
+        sources[bucket.key] = (
+            bucket.doc_count,
+            date_parser.parse(newest) if newest else None,
+        )
+    return sources
+
+
+def current():
+    """Current generation, or None when Elasticsearch can't be reached"""
+    generation = cache.get(CACHE_KEY)
+    if generation is not None:
+        return generation
+    try:
+        sources = fetch_source_counts()
+    except Overloaded:
+        raise
+    except Exception:
+        logger.warning("Could not read the index generation", exc_info=True)
+        return None
+    generation = Generation(sources)
+    cache.set(CACHE_KEY, generation, settings.INDEX_GENERATION_TTL)
+    return generation
+
+
+def _scoped_etag(request, scope):
+    generation = current()
+    if generation is None:
+        return None
+    return '"{}-{}"'.format(generation.token(scope), _path_hash(request))
+
+
+def index_etag(request, *args, **kwargs):
+    return _scoped_etag(request, None)
+
+
+def index_last_modified(request, *args, **kwargs):
+    generation = current()
+    return generation.last_modified() if generation else None
+
+
+def source_etag(request, *args, **kwargs):
+    return _scoped_etag(request, request.GET.get("q", ""))
+
+
+def source_last_modified(request, *args, **kwargs):
+    generation = current()
+    return generation.last_modified(request.GET.get("q", "")) if generation else None
+
+
+def job_etag(request, *args, **kwargs):
+    """Jobs are never updated after ingest, their page only changes on deploy"""
+    raw = "{}:{}".format(settings.RELEASE, request.get_full_path())
+    return '"{}"'.format(hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16])
+
+
+def _path_hash(request):
+    return hashlib.sha1(request.get_full_path().encode("utf-8")).hexdigest()[:8]
@@ -0,0 +1,304 @@
+"""
+Request instrumentation for Juno Jobs
+
+Collects per-request timings (Elasticsearch round trips, query parsing, date
+conversion, template rendering, cache lookups) and process-wide metrics that
+are exported as `Server-Timing` headers and in Prometheus text format.
+
+Usage:
+    with timer("parse"):
+        base_query = build_search_query(q)
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from elasticsearch import Transport
+
+from rss import admission
+
+logger = logging.getLogger(__name__)
+slowlog = logging.getLogger("rss.slowlog")
+
+# Histogram buckets in seconds, shared by every timing metric
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Human readable descriptions used in Server-Timing and # HELP lines
+DESCRIPTIONS = {
+    "es": "Elasticsearch round trips",
+    "parse": "Query parsing",
+    "dates": "Date conversion",
+    "render": "Template rendering",
+    "cache": "Cache lookups",
+    "suggest": "Suggestion lookup",
+    "cards": "Job card fragments",
+    "queue": "Waiting for an Elasticsearch slot",
+}
+
+
+class RequestMetrics:
+    """Timings collected while serving a single request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.es_took = 0
+        self.es_hits = 0
+        self.cache_hit = False
+
+    def add(self, name, duration):
+        count, total = self.timings.get(name, (0, 0.0))
+        self.timings[name] = (count + 1, total + duration)
+
+    def server_timing(self):
+        """Render the collected timings as a Server-Timing header value"""
+        entries = []
+        for name, (count, total) in self.timings.items():
+            desc = DESCRIPTIONS.get(name, name)
+            if count > 1:
+                desc = f"{desc} (x{count})"
+            entries.append(f'{name};dur={total * 1000:.1f};desc="{desc}"')
+        total = time.perf_counter() - self.started
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ", ".join(entries)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe process-wide counters and histograms. Every series is
+    rendered with the `pid` of the process, so that scrapes reaching different
+    gunicorn workers are distinct series instead of counter resets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def inc(self, name, labels=None, value=1, help=""):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help)
+
+    def observe(self, name, value, labels=None, help=""):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(BUCKETS), 0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += 1
+            hist[2] += value
+            self._help.setdefault(name, help)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        process = (("pid", os.getpid()),)
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+            help_texts = dict(self._help)
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_texts.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels + process)} {value}")
+
+        for (name, labels), (buckets, count, total) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_texts.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            labels += process
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{_format_labels(inf_labels)} {count}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+# Singleton instance
+registry = MetricsRegistry()
+
+_local = threading.local()
+
+
+def start_request():
+    """Begin collecting metrics for the request served by this thread"""
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def end_request():
+    metrics = getattr(_local, "metrics", None)
+    _local.metrics = None
+    return metrics
+
+
+def current():
+    """Metrics of the request being served by this thread, if any"""
+    return getattr(_local, "metrics", None)
+
+
+def record(name, duration):
+    """Record a timing both for the current request and process-wide"""
+    metrics = current()
+    if metrics is not None:
+        metrics.add(name, duration)
+    registry.observe(
+        "junojobs_stage_duration_seconds",
+        duration,
+        {"stage": name},
+        help="Time spent per request stage",
+    )
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class InstrumentedTransport(Transport):
+    """
+    Transport that times every Elasticsearch round trip and, when
+    ES_PROFILE_SLOW_QUERIES is enabled, re-runs slow searches with
+    `profile: true` and writes the profile to the slow-query log.
+    At most ES_MAX_IN_FLIGHT requests per process run at the same time.
+    """
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        with admission.es_slot():
+            response, duration = self._perform_request(method, url, headers, params, body)
+        # Logged, and profiled, once the slot is free again
+        if isinstance(response, dict) and url.endswith("/_search"):
+            if duration * 1000 >= settings.ES_SLOW_QUERY_MS:
+                self._log_slow_query(method, url, headers, params, body, duration)
+        return response
+
+    def _perform_request(self, method, url, headers, params, body):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            response = super().perform_request(
+                method, url, headers=headers, params=params, body=body
+            )
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            record("es", duration)
+            registry.observe(
+                "junojobs_es_request_duration_seconds",
+                duration,
+                {"endpoint": _endpoint(url), "status": status},
+                help="Elasticsearch round trip latency",
+            )
+
+        if isinstance(response, dict):
+            self._record_response(response)
+        return response, duration
+
+    def _record_response(self, response):
+        metrics = current()
+        took = response.get("took")
+        hits = response.get("hits", {}).get("total")
+        if isinstance(hits, dict):
+            hits = hits.get("value")
+        if took is not None:
+            registry.observe(
+                "junojobs_es_took_seconds",
+                took / 1000,
+                help="Server-side search time reported by Elasticsearch",
+            )
+        if metrics is not None:
+            metrics.es_took += took or 0
+            metrics.es_hits += hits or 0
+
+    def _log_slow_query(self, method, url, headers, params, body, duration):
+        registry.inc(
+            "junojobs_es_slow_queries_total",
+            help="Searches slower than ES_SLOW_QUERY_MS",
+        )
+        if not settings.ES_PROFILE_SLOW_QUERIES or not isinstance(body, dict):
+            slowlog.warning("slow query %.0fms %s %s", duration * 1000, url, body)
+            return
+        if body.get("profile"):
+            return
+        # Profiled in the background, one query at a time, off the request path
+        if not _profiling.acquire(blocking=False):
+            slowlog.warning("slow query %.0fms %s %s (not profiled)", duration * 1000, url, body)
+            return
+        threading.Thread(
+            target=self._profile_slow_query,
+            args=(method, url, headers, params, body, duration),
+            name="slow-query-profile",
+            daemon=True,
+        ).start()
+
+    def _profile_slow_query(self, method, url, headers, params, body, duration):
+        profiled = copy.deepcopy(body)
+        profiled["profile"] = True
+        try:
+            with admission.es_slot():
+                response = super().perform_request(
+                    method, url, headers=headers, params=params, body=profiled
+                )
+        except Exception:
+            logger.exception("Could not profile slow query %s", url)
+            return
+        finally:
+            _profiling.release()
+        slowlog.warning(
+            "slow query %.0fms %s %s profile=%s",
+            duration * 1000,
+            url,
+            body,
+            response.get("profile"),
+        )
+
+
+_profiling = threading.Lock()
+
+
+def _endpoint(url):
+    """Reduce a request path to a low-cardinality label, e.g. `_search`"""
+    for part in reversed(url.split("?")[0].split("/")):
+        if part.startswith("_"):
+            return part
+    return "other"
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rss import querylog
+
+
+class Command(BaseCommand):
+    help = (
+        "Find the most frequent searches of the query log and store them for "
+        "the POPULAR list and the cache warm-up"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.QUERY_LOG_WINDOW_DAYS,
+            help="Number of daily logs to aggregate, older ones are deleted",
+        )
+        parser.add_argument(
+            "--top", type=int, default=settings.QUERY_LOG_TOP, help="Number of queries to keep"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stats = querylog.aggregate(options["days"], options["top"])
+        # Workers cache the POPULAR list for CACHE_TIME_POPULAR, the new rows
+        # are picked up when it expires
+        rows = querylog.save_popular(stats)
+        deleted = querylog.delete_old_logs(options["days"])
+
+        for row in rows[:20]:
+            self.stdout.write(
+                "{:>4} {:>7} {:>8.1f}ms {:>5.0%} cached {:>5.0%} empty  {}".format(
+                    row.rank,
+                    row.count,
+                    row.avg_latency_ms,
+                    row.cache_hit_ratio,
+                    row.empty_ratio,
+                    querylog.search_url((row.q, row.source_list(), row.category_list(), row.date)),
+                )
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Aggregated {} searches into {} popular queries in {:.2f}s, deleted {} old logs".format(
+                    stats.records, len(rows), time.perf_counter() - start, deleted
+                )
+            )
+        )
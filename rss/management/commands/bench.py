@@ -0,0 +1,170 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+
+from rss.benchmarks import suite
+from rss.benchmarks.corpus import generate_corpus
+from rss.benchmarks.fake_es import FakeConnection, RecordingConnection
+from rss.instrumentation import InstrumentedTransport
+
+DUMMY_CACHE = {
+    alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"} for alias in settings.CACHES
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run micro and end-to-end benchmarks of the search stack against an "
+        "in-process Elasticsearch stand-in"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=2000, help="Synthetic corpus size")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--only",
+            choices=[suite.MICRO, suite.REQUEST, suite.ALERTS],
+            help="Run a single group",
+        )
+        parser.add_argument(
+            "--select", nargs="+", help="Only run benchmarks whose name contains one of these"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Simulated ES latency in ms"
+        )
+        parser.add_argument(
+            "--recordings", help="Replay ES responses recorded with --record"
+        )
+        parser.add_argument(
+            "--record",
+            metavar="PATH",
+            help="Run request benchmarks against the real cluster and save its responses",
+        )
+        parser.add_argument(
+            "--with-cache",
+            action="store_true",
+            help="Keep the configured cache (measures cache hits instead of rendering)",
+        )
+        parser.add_argument(
+            "--alert-sizes",
+            type=int,
+            nargs="+",
+            default=list(suite.ALERT_SIZES),
+            help="Numbers of saved searches the alert matcher is benchmarked with",
+        )
+        parser.add_argument("--output", help="Write results as JSON")
+        parser.add_argument("--compare", help="Compare with a previous --output file")
+
+    def handle(self, *args, **options):
+        import rss.views  # noqa: F401 creates the default connection, replaced below
+
+        setup_test_environment()
+        corpus = generate_corpus(options["docs"], options["seed"])
+
+        if options["record"]:
+            connections.create_connection(
+                hosts=[rss.views.es_url],
+                connection_class=RecordingConnection,
+                transport_class=InstrumentedTransport,
+            )
+            hit = Search(index="rss")[:1].execute().hits[0]
+            sample = (hit.meta.id, hit.source)
+        else:
+            FakeConnection.load(corpus, options["recordings"], options["latency"] / 1000)
+            connections.create_connection(
+                hosts=["localhost"],
+                connection_class=FakeConnection,
+                transport_class=InstrumentedTransport,
+            )
+            doc_id, doc = corpus[len(corpus) // 2]
+            sample = (doc_id, doc["source"])
+
+        results = {}
+        iterations = options["iterations"]
+        if options["only"] in (None, suite.MICRO):
+            results.update(
+                suite.run(
+                    suite.micro_benchmarks(corpus), suite.MICRO, iterations * 10,
+                    select=options["select"],
+                )
+            )
+        if options["only"] in (None, suite.REQUEST):
+            caches = {} if options["with_cache"] else {"CACHES": DUMMY_CACHE}
+            # Every benchmark request comes from the same client
+            with override_settings(ADMISSION_CONTROL=False, **caches):
+                results.update(
+                    suite.run(
+                        suite.request_benchmarks(*sample), suite.REQUEST, iterations,
+                        select=options["select"],
+                    )
+                )
+
+        if options["only"] in (None, suite.ALERTS):
+            results.update(
+                suite.run(
+                    suite.alert_benchmarks(corpus, options["alert_sizes"]),
+                    suite.ALERTS,
+                    max(iterations // 10, 3),
+                    warmup=1,
+                    select=options["select"],
+                )
+            )
+
+        if options["record"]:
+            RecordingConnection.save(options["record"])
+            self.stdout.write("Recorded ES responses to {}".format(options["record"]))
+
+        self.print_results(results)
+
+        if options["output"]:
+            meta = suite.metadata(
+                docs=options["docs"],
+                seed=options["seed"],
+                latency_ms=options["latency"],
+                alert_sizes=options["alert_sizes"],
+                with_cache=options["with_cache"],
+                recordings=options["recordings"] or options["record"],
+            )
+            with open(options["output"], "w") as f:
+                json.dump({"meta": meta, "results": results}, f, indent=2)
+            self.stdout.write("Results written to {}".format(options["output"]))
+
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError("Cannot read {}: {}".format(options["compare"], e))
+            self.print_comparison(results, baseline)
+
+    def print_results(self, results):
+        self.stdout.write(
+            "{:<32} {:>10} {:>10} {:>10}".format("benchmark", "median ms", "p95 ms", "min ms")
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                "{:<32} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                    name, r["median_ms"], r["p95_ms"], r["min_ms"]
+                )
+            )
+
+    def print_comparison(self, results, baseline):
+        self.stdout.write(
+            "\nCompared with {} ({})".format(
+                baseline["meta"].get("commit"), baseline["meta"].get("date")
+            )
+        )
+        for name, old, new, change, verdict in suite.compare(results, baseline["results"]):
+            line = "{:<32} {:>10.3f} -> {:>10.3f} {:>+8.1%} {}".format(
+                name, old, new, change, verdict
+            )
+            if verdict == "slower":
+                line = self.style.ERROR(line)
+            elif verdict == "faster":
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
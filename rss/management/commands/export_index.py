@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import Elasticsearch
+
+from rss import snapshots
+from rss.progress import Progress
+
+
+class Command(BaseCommand):
+    help = "Export an index to a directory of compressed NDJSON shards, with a sliced scroll"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Snapshot directory, created if needed")
+        parser.add_argument("--index", default="rss")
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Scroll slices read in parallel, one shard each"
+        )
+        parser.add_argument("--compression", choices=sorted(snapshots.COMPRESSIONS), default="gzip")
+        parser.add_argument("--page-size", type=int, default=1000, help="Jobs per scroll page")
+
+    def handle(self, *args, **options):
+        import rss.views
+
+        # Not the default connection: its requests count against the web app's in-flight limit
+        es = Elasticsearch(
+            hosts=[rss.views.es_url],
+            timeout=120,
+            retry_on_timeout=True,
+            maxsize=options["workers"] + 1,
+        )
+        progress = Progress()
+        try:
+            with progress.reporting(self.stdout.write):
+                manifest = snapshots.export_index(
+                    es,
+                    options["directory"],
+                    index=options["index"],
+                    workers=options["workers"],
+                    compression=options["compression"],
+                    page_size=options["page_size"],
+                    progress=progress,
+                )
+        except snapshots.SnapshotError as e:
+            raise CommandError(e)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Exported {} jobs in {} shards: {}".format(
+                    sum(manifest["done"].values()), len(manifest["done"]), progress.summary()
+                )
+            )
+        )
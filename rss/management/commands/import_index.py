@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import Elasticsearch
+
+from rss import snapshots
+from rss.progress import Progress
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a snapshot written by export_index with parallel bulk requests, "
+        "resuming after the last checkpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Snapshot directory")
+        parser.add_argument(
+            "--index", help="Index to import into, created with the snapshot mapping if missing"
+        )
+        parser.add_argument("--workers", type=int, default=4, help="Shards imported in parallel")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Jobs per bulk request")
+        parser.add_argument(
+            "--op-type",
+            choices=("index", "create"),
+            default="index",
+            help="`create` keeps the jobs already in the index",
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore the checkpoint and import everything"
+        )
+
+    def handle(self, *args, **options):
+        import rss.views
+
+        # Not the default connection: its requests count against the web app's in-flight limit
+        es = Elasticsearch(
+            hosts=[rss.views.es_url],
+            timeout=120,
+            retry_on_timeout=True,
+            maxsize=options["workers"] + 1,
+        )
+        progress = Progress()
+        try:
+            with progress.reporting(self.stdout.write):
+                snapshots.import_index(
+                    es,
+                    options["directory"],
+                    index=options["index"],
+                    workers=options["workers"],
+                    chunk_size=options["chunk_size"],
+                    op_type=options["op_type"],
+                    restart=options["restart"],
+                    progress=progress,
+                )
+        except snapshots.SnapshotError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS("Imported " + progress.summary()))
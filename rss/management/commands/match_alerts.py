@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from rss.alerts import run_alerts
+
+
+class Command(BaseCommand):
+    help = (
+        "Match the jobs ingested since the last run against every saved search "
+        "and queue the matches for the next alert digest"
+    )
+
+    def handle(self, *args, **options):
+        run = run_alerts()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Matched {} jobs against {} saved searches: {} new alerts in {:.2f}s".format(
+                    run.docs, run.saved_searches, run.matches, run.duration
+                )
+            )
+        )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rss.alerts import send_digests
+
+
+class Command(BaseCommand):
+    help = "Email every subscriber the jobs queued for their saved searches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default=settings.ALERTS_BASE_URL,
+            help="Absolute URL of the site, used for job and unsubscribe links",
+        )
+
+    def handle(self, *args, **options):
+        sent = send_digests(options["base_url"].rstrip("/"))
+        self.stdout.write(self.style.SUCCESS("Sent {} alert digests".format(sent)))
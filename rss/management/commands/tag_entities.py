@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from elasticsearch import Elasticsearch
+
+from rss import entities
+from rss.progress import Progress
+
+
+class Command(BaseCommand):
+    help = (
+        "Tag the jobs already indexed with the skills, locations and seniority "
+        "levels of node/vocabulary.json, as node/ingest.js does for new jobs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default="rss")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Jobs per bulk request")
+
+    def handle(self, *args, **options):
+        import rss.views
+
+        # Not the default connection: its requests count against the web app's in-flight limit
+        es = Elasticsearch(hosts=[rss.views.es_url], timeout=120, retry_on_timeout=True)
+        progress = Progress()
+        with progress.reporting(self.stdout.write):
+            updated = entities.tag_index(
+                es, index=options["index"], chunk_size=options["chunk_size"], progress=progress
+            )
+        self.stdout.write(
+            self.style.SUCCESS("Tagged {} jobs, scanned {}".format(updated, progress.summary()))
+        )
@@ -0,0 +1,68 @@
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rss import querylog
+from rss.models import PopularQuery
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the most frequent searches (see aggregate_queries) so that "
+        "their pages, job cards and Elasticsearch caches are warm"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default=settings.ALERTS_BASE_URL,
+            help="Absolute URL of the site to warm",
+        )
+        parser.add_argument(
+            "--top", type=int, default=settings.QUERY_LOG_TOP, help="Number of queries to request"
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Requests per query, to reach more workers when caches are per process",
+        )
+
+    def handle(self, *args, **options):
+        base_url = options["base_url"].rstrip("/")
+        rows = PopularQuery.objects.order_by("rank")[: options["top"]]
+        session = requests.Session()
+        start = time.perf_counter()
+        warmed = failed = 0
+        for row in rows:
+            url = base_url + querylog.search_url(
+                (row.q, row.source_list(), row.category_list(), row.date)
+            )
+            for _ in range(options["repeat"]):
+                if self._get(session, url):
+                    warmed += 1
+                else:
+                    failed += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Warmed {} pages in {:.1f}s, {} failed".format(
+                    warmed, time.perf_counter() - start, failed
+                )
+            )
+        )
+
+    def _get(self, session, url):
+        for _ in range(3):
+            try:
+                response = session.get(url, timeout=30)
+            except requests.RequestException as e:
+                self.stderr.write("{}: {}".format(url, e))
+                return False
+            # Rate limited by admission control, wait as told
+            if response.status_code in (429, 503) and "Retry-After" in response.headers:
+                time.sleep(min(int(response.headers["Retry-After"]), 30))
+                continue
+            return response.status_code == 200
+        return False
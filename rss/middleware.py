@@ -0,0 +1,75 @@
+import time
+from functools import wraps
+
+from rss import instrumentation, querylog
+from rss.instrumentation import registry, timer
+from rss.page_cache import FetchFromCacheMiddleware
+
+
+class InstrumentationMiddleware:
+    """
+    Collects per-request timings and exposes them as a Server-Timing header.
+    Must be the first middleware so that cache hits are measured too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = instrumentation.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.end_request()
+
+        response["Server-Timing"] = metrics.server_timing()
+        querylog.record(request, response, metrics)
+        registry.observe(
+            "junojobs_http_request_duration_seconds",
+            time.perf_counter() - metrics.started,
+            {"view": _view_name(request, metrics), "status": response.status_code},
+            help="Total time spent serving a request",
+        )
+        return response
+
+
+class TimedFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    """FetchFromCacheMiddleware that records lookup time and hit ratio"""
+
+    def process_request(self, request):
+        with timer("cache"):
+            response = super().process_request(request)
+        hit = response is not None
+        metrics = instrumentation.current()
+        if metrics is not None:
+            metrics.cache_hit = hit
+        registry.inc(
+            "junojobs_page_cache_requests_total",
+            {"result": "hit" if hit else "miss"},
+            help="Site-wide page cache lookups",
+        )
+        return response
+
+
+def _view_name(request, metrics):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Page cache hits are served before URL resolution
+        return "cache" if metrics.cache_hit else "unresolved"
+    return match.view_name or "unresolved"
+
+
+def no_page_cache(view):
+    """
+    Keep a view's responses out of the site-wide page cache without sending
+    no-cache headers to clients. Used by listings that are assembled from
+    cached fragments, where whole-page entries would only duplicate them.
+    """
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        request._cache_update_cache = False
+        return response
+
+    return wrapped
@@ -0,0 +1,55 @@
+# Generated by Django 2.1.7 on 2026-10-19 01:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0002_feedback_read'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_id', models.CharField(max_length=2000)),
+                ('title', models.CharField(max_length=500)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent', models.BooleanField(db_index=True, default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AlertRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('checkpoint', models.DateTimeField(null=True)),
+                ('docs', models.IntegerField(default=0)),
+                ('saved_searches', models.IntegerField(default=0)),
+                ('matches', models.IntegerField(default=0)),
+                ('duration', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('query', models.CharField(max_length=200)),
+                ('sources', models.TextField(blank=True, default='')),
+                ('categories', models.TextField(blank=True, default='')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('confirmed', models.BooleanField(db_index=True, default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='alertnotification',
+            name='saved_search',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='rss.SavedSearch'),
+        ),
+    ]
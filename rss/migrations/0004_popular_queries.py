@@ -0,0 +1,32 @@
+# Generated by Django 2.1.7 on 2026-10-19 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0003_saved_searches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.IntegerField()),
+                ('q', models.CharField(max_length=100)),
+                ('sources', models.TextField(blank=True, default='')),
+                ('categories', models.TextField(blank=True, default='')),
+                ('date', models.CharField(blank=True, default='', max_length=10)),
+                ('count', models.IntegerField()),
+                ('avg_latency_ms', models.FloatField()),
+                ('cache_hit_ratio', models.FloatField()),
+                ('empty_ratio', models.FloatField()),
+                ('computed', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['rank'],
+            },
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 
@@ -5,3 +7,73 @@ class Feedback(models.Model):
     sender_email = models.EmailField()
     message = models.CharField(max_length=10000)
     read = models.BooleanField(default=False)
+
+
+class SavedSearch(models.Model):
+    """A search the user wants to be alerted about when new jobs match it"""
+    email = models.EmailField()
+    query = models.CharField(max_length=200)
+    sources = models.TextField(blank=True, default="")  # one source name per line
+    categories = models.TextField(blank=True, default="")  # one category per line
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Set from the link of the confirmation email, only confirmed searches get alerts
+    confirmed = models.BooleanField(default=False, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{} <{}>".format(self.query, self.email)
+
+    def source_list(self):
+        return [s for s in self.sources.splitlines() if s.strip()]
+
+    def category_list(self):
+        return [c for c in self.categories.splitlines() if c.strip()]
+
+
+class AlertNotification(models.Model):
+    """A new job matching a saved search, waiting to be sent in a digest"""
+    saved_search = models.ForeignKey(
+        SavedSearch, on_delete=models.CASCADE, related_name="notifications"
+    )
+    doc_id = models.CharField(max_length=2000)
+    title = models.CharField(max_length=500)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.BooleanField(default=False, db_index=True)
+
+
+class AlertRun(models.Model):
+    """One batch match of newly ingested jobs against all saved searches"""
+    started = models.DateTimeField(auto_now_add=True)
+    # Newest `ingestedAt` seen by this run, the next run starts after it
+    checkpoint = models.DateTimeField(null=True)
+    docs = models.IntegerField(default=0)
+    saved_searches = models.IntegerField(default=0)
+    matches = models.IntegerField(default=0)
+    duration = models.FloatField(default=0.0)
+
+
+class PopularQuery(models.Model):
+    """One of the most frequent searches, from the last query log aggregation"""
+    rank = models.IntegerField()
+    q = models.CharField(max_length=100)
+    sources = models.TextField(blank=True, default="")  # one source name per line
+    categories = models.TextField(blank=True, default="")  # one category per line
+    date = models.CharField(max_length=10, blank=True, default="")
+    # Count-min estimates over QUERY_LOG_WINDOW_DAYS, never under-estimated
+    count = models.IntegerField()
+    avg_latency_ms = models.FloatField()
+    cache_hit_ratio = models.FloatField()
+    empty_ratio = models.FloatField()
+    computed = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["rank"]
+
+    def __str__(self):
+        return self.q
+
+    def source_list(self):
+        return [s for s in self.sources.splitlines() if s.strip()]
+
+    def category_list(self):
+        return [c for c in self.categories.splitlines() if c.strip()]
@@ -0,0 +1,256 @@
+"""
+Page cache storing pre-compressed responses
+
+Drop-in replacements for Django's UpdateCacheMiddleware,
+FetchFromCacheMiddleware and `cache_page`. Cached pages are compressed once,
+when they are written, and stored as a CompressedPage holding a brotli (when
+the `brotli` package is installed) and a gzip variant instead of the rendered
+HTML. Hits, and the miss that fills the entry, are served as the variant
+matching `Accept-Encoding`, without compressing anything:
+
+    Accept-Encoding: br, gzip   ->  brotli body, `Content-Encoding: br`
+    Accept-Encoding: gzip       ->  gzip body, `Content-Encoding: gzip`
+    (none)                      ->  gzip body decompressed
+
+Entries are keyed like Django's, without `Accept-Encoding`: a single entry
+serves every client, and `Vary: Accept-Encoding` is only added to the
+responses sent.
+"""
+
+import gzip
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.http import HttpResponse
+from django.middleware import cache as django_cache
+from django.utils.cache import (
+    get_cache_key,
+    get_max_age,
+    has_vary_header,
+    learn_cache_key,
+    patch_response_headers,
+    patch_vary_headers,
+)
+from django.utils.decorators import decorator_from_middleware_with_args
+
+from rss.instrumentation import registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when the client accepts several with the same quality
+ENCODINGS = ("br", "gzip")
+# Not worth compressing, stored as is
+MIN_COMPRESS_SIZE = 200
+
+_accept_re = re.compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    """`{coding: quality}` parsed from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or "").split(","):
+        match = _accept_re.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = quality
+    return accepted
+
+
+def negotiate(header, available):
+    """Best of the `available` encodings for an Accept-Encoding header, or None"""
+    accepted = accepted_encodings(header)
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content):
+    """`{encoding: body}` variants of `content`, computed once per cache write"""
+    if len(content) < MIN_COMPRESS_SIZE:
+        return {"identity": content}
+    variants = {"gzip": gzip.compress(content, settings.PAGE_CACHE_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(content, quality=settings.PAGE_CACHE_BROTLI_QUALITY)
+    return variants
+
+
+class CompressedPage:
+    """A cacheable response: status, headers, cookies and encoded bodies"""
+
+    __slots__ = ("status", "headers", "cookies", "variants")
+
+    def __init__(self, status, headers, cookies, variants):
+        self.status = status
+        self.headers = headers
+        self.cookies = cookies
+        self.variants = variants
+
+    @classmethod
+    def from_response(cls, response):
+        headers = [(k, v) for k, v in response.items() if k.lower() != "content-length"]
+        return cls(response.status_code, headers, response.cookies, compress(response.content))
+
+    def size(self):
+        return sum(len(body) for body in self.variants.values())
+
+    def to_response(self, request):
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING"), self.variants)
+        if encoding is not None:
+            content = self.variants[encoding]
+        elif "identity" in self.variants:
+            content = self.variants["identity"]
+        else:
+            # Clients without gzip support are rare, they pay for it
+            content = gzip.decompress(self.variants["gzip"])
+
+        response = HttpResponse(content, status=self.status)
+        for header, value in self.headers:
+            response[header] = value
+        response.cookies = self.cookies
+        response["Content-Length"] = str(len(content))
+        if "identity" not in self.variants:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        if encoding is not None:
+            response["Content-Encoding"] = encoding
+            weaken_etag(response)
+        registry.inc(
+            "junojobs_page_cache_served_total",
+            {"encoding": encoding or "identity"},
+            help="Cached pages served, by content encoding",
+        )
+        return response
+
+
+def record_write(rendered_size, page):
+    registry.inc(
+        "junojobs_page_cache_rendered_bytes_total",
+        value=rendered_size,
+        help="Uncompressed size of the pages written to the page cache",
+    )
+    registry.inc(
+        "junojobs_page_cache_stored_bytes_total",
+        value=page.size(),
+        help="Size of the page cache entries written, all encodings",
+    )
+
+
+def weaken_etag(response):
+    """The same ETag is sent for every encoding, so it can only be weak"""
+    etag = response.get("ETag")
+    if etag and etag.startswith('"') and response.has_header("Content-Encoding"):
+        response["ETag"] = "W/" + etag
+
+
+class _RequestCache:
+    """
+    The cache is looked up on every request instead of once, so that
+    `override_settings(CACHES=...)` also applies to views decorated at import
+    """
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @cache.setter
+    def cache(self, value):
+        # Assigned by Django's __init__, `cache_alias` is enough
+        pass
+
+
+class UpdateCacheMiddleware(_RequestCache, django_cache.UpdateCacheMiddleware):
+    """UpdateCacheMiddleware storing CompressedPage entries"""
+
+    def process_response(self, request, response):
+        # Conditional views set their ETag after the cache layer has encoded the body
+        weaken_etag(response)
+        if not self._should_update_cache(request, response):
+            return response
+        if response.streaming or response.status_code not in (200, 304):
+            return response
+        # Encoded by someone else, it can't be stored as a CompressedPage
+        if response.has_header("Content-Encoding"):
+            return response
+        if not request.COOKIES and response.cookies and has_vary_header(response, "Cookie"):
+            return response
+        if "private" in response.get("Cache-Control", ()):
+            return response
+
+        timeout = get_max_age(response)
+        if timeout is None:
+            timeout = self.cache_timeout
+        elif timeout == 0:
+            return response
+        patch_response_headers(response, timeout)
+        if not (timeout and response.status_code == 200):
+            return response
+        # Nothing would be stored (DEBUG), don't pay for the compression
+        if isinstance(self.cache, DummyCache):
+            return response
+
+        cache_key = learn_cache_key(request, response, timeout, self.key_prefix, cache=self.cache)
+
+        def store(rendered):
+            page = CompressedPage.from_response(rendered)
+            self.cache.set(cache_key, page, timeout)
+            record_write(len(rendered.content), page)
+            # Outer cache layers (the site-wide middleware around `cache_page`)
+            # would store the same page again
+            request._cache_update_cache = False
+            return page.to_response(request)
+
+        if hasattr(response, "render") and callable(response.render) and not response.is_rendered:
+            response.add_post_render_callback(store)
+            return response
+        return store(response)
+
+
+class FetchFromCacheMiddleware(_RequestCache, django_cache.FetchFromCacheMiddleware):
+    """FetchFromCacheMiddleware serving CompressedPage entries"""
+
+    def process_request(self, request):
+        if request.method not in ("GET", "HEAD"):
+            request._cache_update_cache = False
+            return None
+
+        cache_key = get_cache_key(request, self.key_prefix, "GET", cache=self.cache)
+        if cache_key is None:
+            request._cache_update_cache = True
+            return None
+        page = self.cache.get(cache_key)
+        if page is None and request.method == "HEAD":
+            cache_key = get_cache_key(request, self.key_prefix, "HEAD", cache=self.cache)
+            page = self.cache.get(cache_key)
+        if page is None:
+            request._cache_update_cache = True
+            return None
+
+        request._cache_update_cache = False
+        if isinstance(page, CompressedPage):
+            return page.to_response(request)
+        # Entry written by Django's own cache middleware
+        return page
+
+
+class CacheMiddleware(UpdateCacheMiddleware, FetchFromCacheMiddleware, django_cache.CacheMiddleware):
+    pass
+
+
+def cache_page(timeout, *, cache=None, key_prefix=None):
+    """`django.views.decorators.cache.cache_page` storing compressed pages"""
+    return decorator_from_middleware_with_args(CacheMiddleware)(
+        cache_timeout=timeout, cache_alias=cache, key_prefix=key_prefix
+    )
@@ -0,0 +1,48 @@
+"""
+Progress of the bulk management commands (export_index, import_index,
+tag_entities), reported periodically from their worker threads
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Progress:
+    """Thread-safe document and byte counters with a rate"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.docs = 0
+        self.bytes = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def add(self, docs, nbytes=0, errors=0):
+        with self._lock:
+            self.docs += docs
+            self.bytes += nbytes
+            self.errors += errors
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        return "{} docs in {:.1f}s, {:.0f} docs/s, {:.1f} MB/s of NDJSON, {} errors".format(
+            self.docs, elapsed, self.docs / elapsed, self.bytes / elapsed / 1e6, self.errors
+        )
+
+    @contextmanager
+    def reporting(self, write, interval=5.0):
+        """Call `write(summary)` every `interval` seconds while in the block"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                write(self.summary())
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,230 @@
+"""
+Cost guard for the raw `query_string` fallback of the query parser
+
+Queries in which SmartQueryParser recognizes nothing are run as a Lucene
+`query_string`, where leading wildcards, regular expressions, fuzzy terms,
+ranges and long boolean expressions can expand to thousands of terms, keep
+Elasticsearch busy for seconds or fail with a parse error. `guard()` analyses
+the query first and picks the cheapest form that keeps its meaning.
+
+The parser only falls back to it when every word of the query is a stop
+word or at most two characters long: longer words such as `*script`, `pyth~2`
+or `/jav.*/` become general terms of a `multi_match`, whose analyzer drops
+the operators as punctuation. What reaches `guard()` are short operator
+queries:
+
+    qa js                         ->  query_string
+    c*, ?a, /a/                   ->  simple_query_string, without the
+                                      expensive operator
+    ( ( ( ( ( ux ) ) ) ) )        ->  multi_match, too deep
+    b0 OR b1 OR ... (40 terms)    ->  multi_match over the first
+                                      QUERY_MAX_CLAUSES words
+
+`query_string` queries are still run with `allow_leading_wildcard: false`
+and a `top_terms_N` rewrite, so that Elasticsearch never expands a term into
+more than QUERY_MAX_EXPANSIONS terms whatever the estimate said. Rewrites are
+counted in `junojobs_query_rewrites_total`; queries longer than
+QUERY_MAX_LENGTH or with more than QUERY_REJECT_CLAUSES clauses are refused
+by admission control (see rss/admission.py) before reaching the parser.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+from rss import instrumentation
+
+FIELDS = ["title^2", "body"]
+# Fields a query may name explicitly (`title:python`)
+SEARCHABLE_FIELDS = {"title", "body", "category", "source"}
+
+# Operators kept when a query is downgraded to simple_query_string
+SIMPLE_FLAGS = "AND|OR|NOT|PHRASE|PRECEDENCE|WHITESPACE|ESCAPE"
+
+# Estimated number of index terms a prefix of that many characters expands to
+PREFIX_EXPANSIONS = {0: float("inf"), 1: 1000, 2: 250, 3: 60}
+LONG_PREFIX_EXPANSIONS = 15
+# Estimated expansions of a fuzzy term, by edit distance
+FUZZY_EXPANSIONS = {0: 1, 1: 10, 2: 50}
+
+_token_re = re.compile(
+    r"""
+      (?P<phrase>"(?:[^"\\]|\\.)*"(?:~[0-9]*)?(?:\^[0-9.]*)?)
+    | (?P<regex>/(?:[^/\\]|\\.)*/)
+    | (?P<range>[\[{][^\]}]*[\]}])
+    | (?P<open>\()
+    | (?P<close>\))
+    | (?P<op>&&|\|\||[+\-!](?=\S))
+    | (?P<term>(?:[^\s()"/\[\]{}\\]|\\.)+)
+    | (?P<error>\S)
+    """,
+    re.VERBOSE,
+)
+_field_re = re.compile(r"^([A-Za-z_][\w.]*)(?<!\\):(.*)$", re.DOTALL)
+_fuzzy_re = re.compile(r"~([0-9.]*)$")
+_boost_re = re.compile(r"\^[0-9.]*$")
+_wildcard_re = re.compile(r"(?<!\\)[*?]")
+_word_re = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class QueryCost:
+    """What a `query_string` would make Elasticsearch do"""
+
+    clauses: int = 0  # leaf queries: terms, phrases, regexes, ranges
+    depth: int = 0  # deepest parenthesis nesting
+    expansions: float = 0  # estimated index terms matched by all the clauses
+    disjunctive: bool = False  # has an OR operator
+    reasons: Tuple[str, ...] = ()  # expensive or invalid constructs found
+
+    @property
+    def plan(self):
+        """`query_string`, `simple_query_string` or `match`"""
+        if self.clauses > settings.QUERY_MAX_CLAUSES or self.depth > settings.QUERY_MAX_DEPTH:
+            return "match"
+        if self.reasons or self.expansions > settings.QUERY_MAX_EXPANSIONS:
+            return "simple_query_string"
+        return "query_string"
+
+    def rejected(self):
+        return self.clauses > settings.QUERY_REJECT_CLAUSES
+
+
+def _term_cost(term):
+    """`(expansions, reason or None)` of a single query_string term"""
+    term = _boost_re.sub("", term)
+    if term.startswith(("<", ">")):
+        return float("inf"), "range"
+    fuzzy = _fuzzy_re.search(term)
+    if fuzzy:
+        term = term[: fuzzy.start()]
+        try:
+            distance = min(int(float(fuzzy.group(1) or 2)), 2)
+        except ValueError:
+            return float("inf"), "syntax"
+        if _wildcard_re.search(term):
+            return float("inf"), "fuzzy"
+        return FUZZY_EXPANSIONS[distance], None
+    wildcard = _wildcard_re.search(term)
+    if wildcard is None:
+        return 1, None
+    if wildcard.start() == 0:
+        return float("inf"), "leading_wildcard"
+    return PREFIX_EXPANSIONS.get(wildcard.start(), LONG_PREFIX_EXPANSIONS), None
+
+
+@lru_cache(maxsize=1024)
+def analyze(query: str) -> QueryCost:
+    """Estimate the cost of running `query` as a query_string"""
+    clauses = depth = max_depth = 0
+    expansions = 0.0
+    disjunctive = False
+    reasons = set()
+
+    for match in _token_re.finditer(query):
+        kind, text = match.lastgroup, match.group()
+        if kind == "open":
+            depth += 1
+            max_depth = max(max_depth, depth)
+        elif kind == "close":
+            depth -= 1
+            if depth < 0:
+                reasons.add("syntax")
+                depth = 0
+        elif kind == "op":
+            disjunctive = disjunctive or text == "||"
+        elif kind == "phrase":
+            clauses += 1
+            expansions += max(len(_word_re.findall(text)), 1)
+        elif kind == "regex":
+            clauses += 1
+            reasons.add("regex")
+        elif kind == "range":
+            clauses += 1
+            reasons.add("range")
+        elif kind == "error":
+            reasons.add("syntax")
+        elif text in ("AND", "NOT"):
+            continue
+        elif text == "OR":
+            disjunctive = True
+        else:
+            field = _field_re.match(text)
+            if field:
+                name, text = field.groups()
+                if name.split(".")[0] not in SEARCHABLE_FIELDS:
+                    reasons.add("field")
+                if not text:
+                    # `title:(...)` or `title:"..."`, the value is the next token
+                    continue
+            clauses += 1
+            cost, reason = _term_cost(text)
+            expansions += cost
+            if reason:
+                reasons.add(reason)
+
+    if depth:
+        reasons.add("syntax")
+    if expansions > settings.QUERY_MAX_EXPANSIONS and not reasons:
+        reasons.add("expansion")
+    return QueryCost(clauses, max_depth, expansions, disjunctive, tuple(sorted(reasons)))
+
+
+def _count(plan, reason):
+    instrumentation.registry.inc(
+        "junojobs_query_rewrites_total",
+        {"plan": plan, "reason": reason},
+        help="Raw queries rewritten to a cheaper query before reaching Elasticsearch",
+    )
+
+
+def guard(query: str) -> Dict:
+    """The cheapest Elasticsearch query equivalent to `query` as a query_string"""
+    cost = analyze(query)
+    plan = cost.plan
+
+    if plan == "match":
+        _count(plan, "depth" if cost.clauses <= settings.QUERY_MAX_CLAUSES else "clauses")
+        words = list(dict.fromkeys(w.lower() for w in _word_re.findall(query)))
+        words = [w for w in words if w not in ("and", "or", "not")]
+        return {
+            "multi_match": {
+                "query": " ".join(words[: settings.QUERY_MAX_CLAUSES]),
+                "fields": FIELDS,
+                "operator": "or" if cost.disjunctive else "and",
+            }
+        }
+
+    if plan == "simple_query_string":
+        for reason in cost.reasons:
+            _count(plan, reason)
+        return {
+            "simple_query_string": {
+                "fields": FIELDS,
+                "query": query,
+                "default_operator": "and",
+                "flags": SIMPLE_FLAGS,
+            }
+        }
+
+    return {
+        "query_string": {
+            "fields": FIELDS,
+            "query": query,
+            "default_operator": "AND",
+            "allow_leading_wildcard": False,
+            "fuzzy_max_expansions": FUZZY_EXPANSIONS[2],
+            "rewrite": "top_terms_{}".format(settings.QUERY_MAX_EXPANSIONS),
+        }
+    }
+
+
+def limit_clauses(clauses):
+    """The first QUERY_MAX_CLAUSES of the `should` clauses built by the parser"""
+    if len(clauses) <= settings.QUERY_MAX_CLAUSES:
+        return clauses
+    _count("bool", "clauses")
+    return clauses[: settings.QUERY_MAX_CLAUSES]
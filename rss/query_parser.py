@@ -12,6 +12,11 @@ import re
 from typing import Dict, List, Set
 from dataclasses import dataclass
 
+from django.conf import settings
+
+from rss.entities import VOCABULARY
+from rss.query_cost import guard, limit_clauses
+
 
 @dataclass
 class SearchParams:
@@ -38,47 +43,19 @@ class SmartQueryParser:
     WITHOUT requiring users to know boolean logic
     """
 
-    # Programming languages and technologies
-    SKILLS = {
-        'python', 'javascript', 'java', 'typescript', 'go', 'golang', 'rust',
-        'c++', 'cpp', 'c#', 'csharp', 'php', 'ruby', 'swift', 'kotlin',
-        'scala', 'r', 'matlab', 'perl', 'shell', 'bash',
-        # Frameworks
-        'react', 'vue', 'angular', 'node', 'nodejs', 'express', 'django',
-        'flask', 'fastapi', 'rails', 'spring', 'springboot', '.net', 'dotnet',
-        'laravel', 'symfony', 'nextjs', 'next.js', 'nuxt', 'svelte',
-        # Databases
-        'sql', 'mysql', 'postgresql', 'postgres', 'mongodb', 'redis',
-        'elasticsearch', 'cassandra', 'dynamodb', 'oracle', 'sqlite',
-        # Cloud & DevOps
-        'aws', 'azure', 'gcp', 'docker', 'kubernetes', 'k8s', 'terraform',
-        'ansible', 'jenkins', 'gitlab', 'github', 'ci/cd',
-        # Data & ML
-        'ml', 'ai', 'machine learning', 'deep learning', 'tensorflow',
-        'pytorch', 'pandas', 'numpy', 'spark', 'hadoop', 'kafka',
-        # Mobile
-        'ios', 'android', 'react native', 'flutter', 'xamarin',
-        # Other
-        'graphql', 'rest', 'api', 'microservices', 'agile', 'scrum',
-    }
+    # Skills, locations and seniority levels, shared with the ingest which
+    # tags jobs with them (see rss/entities.py)
+    SKILLS = set(VOCABULARY["skills"])
+    LOCATION_KEYWORDS = set(VOCABULARY["locations"])
+    SENIORITY_LEVELS = set(VOCABULARY["seniority"])
 
-    # Common location patterns
-    LOCATION_KEYWORDS = {
-        'remote', 'hybrid', 'onsite', 'on-site', 'work from home', 'wfh',
-        # Major cities (expand as needed)
-        'bangalore', 'bengaluru', 'mumbai', 'delhi', 'pune', 'hyderabad',
-        'chennai', 'kolkata', 'ahmedabad', 'gurgaon', 'noida',
-        'san francisco', 'new york', 'london', 'berlin', 'singapore',
-        'tokyo', 'sydney', 'toronto', 'vancouver', 'austin', 'seattle',
-        'boston', 'chicago', 'los angeles', 'paris', 'amsterdam',
-    }
-
-    # Seniority levels
-    SENIORITY_LEVELS = {
-        'junior', 'mid-level', 'mid level', 'senior', 'lead', 'principal',
-        'staff', 'entry level', 'entry-level', 'intern', 'internship',
-        'fresher', 'graduate', 'manager', 'director', 'vp', 'cto', 'ceo',
-    }
+    # Entries of several words, extracted before the query is split in tokens
+    MULTIWORD = [
+        (field, entry)
+        for field in ("skills", "locations", "seniority")
+        for entry in VOCABULARY[field]
+        if " " in entry
+    ]
 
     # Words to ignore
     STOP_WORDS = {
@@ -143,31 +120,10 @@ class SmartQueryParser:
         Extract multi-word patterns (e.g., "machine learning", "react native")
         Returns the query with these patterns removed
         """
-        # Multi-word skills
-        multiword_skills = [
-            'machine learning', 'deep learning', 'react native',
-            'next.js', 'node.js', 'react.js', 'vue.js'
-        ]
-        for skill in multiword_skills:
-            if skill in query:
-                params.skills.add(skill)
-                query = query.replace(skill, ' ')
-
-        # Multi-word locations
-        multiword_locations = [
-            'work from home', 'san francisco', 'new york', 'los angeles'
-        ]
-        for location in multiword_locations:
-            if location in query:
-                params.locations.add(location)
-                query = query.replace(location, ' ')
-
-        # Multi-word seniority
-        multiword_seniority = ['entry level', 'mid level', 'mid-level']
-        for level in multiword_seniority:
-            if level in query:
-                params.seniority.add(level)
-                query = query.replace(level, ' ')
+        for field, entry in self.MULTIWORD:
+            if entry in query:
+                getattr(params, field).add(entry)
+                query = query.replace(entry, ' ')
 
         return query
 
@@ -183,39 +139,51 @@ class SmartQueryParser:
         """
         must_clauses = []
         should_clauses = []
-
-        # Add skills to query (high priority)
-        for skill in params.skills:
-            should_clauses.append({
-                "multi_match": {
-                    "query": skill,
-                    "fields": ["title^3", "body^2", "category"],
-                    "boost": 2.0
-                }
-            })
-
-        # Add locations to query
-        for location in params.locations:
-            should_clauses.append({
-                "multi_match": {
-                    "query": location,
-                    "fields": ["title", "body"],
-                    "boost": 1.5
-                }
-            })
-
-        # Add seniority to query
-        for level in params.seniority:
-            should_clauses.append({
-                "multi_match": {
-                    "query": level,
-                    "fields": ["title^2", "body"],
-                    "boost": 1.5
-                }
-            })
-
-        # Add general terms
-        for term in params.general_terms:
+        filter_clauses = []
+
+        if settings.ENTITY_FILTERS:
+            # Jobs are tagged with these at ingest (see rss/entities.py):
+            # cached keyword filters instead of full-text clauses over the body
+            for field, values in (
+                ("skills", params.skills),
+                ("locations", params.locations),
+                ("seniority", params.seniority),
+            ):
+                if values:
+                    filter_clauses.append({"terms": {field: sorted(values)}})
+        else:
+            # Add skills to query (high priority)
+            for skill in params.skills:
+                should_clauses.append({
+                    "multi_match": {
+                        "query": skill,
+                        "fields": ["title^3", "body^2", "category"],
+                        "boost": 2.0
+                    }
+                })
+
+            # Add locations to query
+            for location in params.locations:
+                should_clauses.append({
+                    "multi_match": {
+                        "query": location,
+                        "fields": ["title", "body"],
+                        "boost": 1.5
+                    }
+                })
+
+            # Add seniority to query
+            for level in params.seniority:
+                should_clauses.append({
+                    "multi_match": {
+                        "query": level,
+                        "fields": ["title^2", "body"],
+                        "boost": 1.5
+                    }
+                })
+
+        # Add general terms, once each
+        for term in dict.fromkeys(params.general_terms):
             should_clauses.append({
                 "multi_match": {
                     "query": term,
@@ -223,24 +191,27 @@ class SmartQueryParser:
                 }
             })
 
-        # If we have extracted entities, use them with should clauses
+        # Recognized entities must all match, general terms score the jobs
+        if filter_clauses:
+            query = {"bool": {"filter": filter_clauses}}
+            if should_clauses:
+                query["bool"]["should"] = limit_clauses(should_clauses)
+                query["bool"]["minimum_should_match"] = 1
+            return query
+
+        # Otherwise any of the general terms (and entities, without ENTITY_FILTERS)
         if should_clauses:
             return {
                 "bool": {
-                    "should": should_clauses,
+                    "should": limit_clauses(should_clauses),
                     "minimum_should_match": 1
                 }
             }
 
-        # Fallback to simple query_string if no entities extracted
+        # Fallback to query_string if no entities extracted, or to a cheaper
+        # query when it would be expensive (see rss/query_cost.py)
         if params.raw_query:
-            return {
-                "query_string": {
-                    "fields": ["title^2", "body"],
-                    "query": params.raw_query,
-                    "default_operator": "AND"
-                }
-            }
+            return guard(params.raw_query)
 
         # Default to match_all
         return {"match_all": {}}
@@ -272,3 +243,36 @@ def build_search_query(query: str) -> Dict:
     """
     params = parser.parse(query)
     return parser.build_elasticsearch_query(params)
+
+
+# Values of the `date` filter on /search/ and the API
+DATE_RANGES = {
+    "24h": "now-1d/d",
+    "7d": "now-7d/d",
+    "30d": "now-30d/d",
+}
+
+
+def build_filtered_query(
+    query: str, sources: List[str] = (), categories: List[str] = (), date_filter: str = ""
+) -> Dict:
+    """
+    Build the Elasticsearch query for a search with optional source,
+    category and date filters, as run by /search/
+
+    Usage:
+        es_query = build_filtered_query("python remote", sources=["RemoteOk"], date_filter="7d")
+    """
+    base_query = build_search_query(query) if query else {"match_all": {}}
+
+    filters = []
+    if sources:
+        filters.append({"terms": {"source": list(sources)}})
+    if categories:
+        filters.append({"terms": {"category": list(categories)}})
+    if date_filter in DATE_RANGES:
+        filters.append({"range": {"pubDate": {"gte": DATE_RANGES[date_filter]}}})
+
+    if not filters:
+        return base_query
+    return {"bool": {"must": base_query, "filter": filters}}
@@ -0,0 +1,321 @@
+"""
+Query log and popularity aggregation
+
+Every search (QUERY_LOG_ROUTES) is recorded by InstrumentationMiddleware as a
+normalized record:
+
+    {"ts": ..., "route": "/search/", "q": "python remote", "sources": [...],
+     "categories": [...], "date": "7d", "latency_ms": 41.2, "hits": 120,
+     "cache_hit": false}
+
+Records are buffered in memory and appended in batches of
+QUERY_LOG_BATCH_SIZE (or every QUERY_LOG_FLUSH_SECONDS) to a daily gzip
+JSON lines file in QUERY_LOG_DIR, from a background thread. Each batch is a
+gzip member written with a single O_APPEND write, so the files stay valid
+with several workers appending to them.
+
+`python manage.py aggregate_queries` reads the last QUERY_LOG_WINDOW_DAYS of
+logs through count-min sketches (counts, latency, cache hits, empty results)
+and keeps the heaviest queries in a bounded candidate set, so memory does
+not grow with the number of distinct queries. The top queries are stored as
+PopularQuery rows, which drive the POPULAR list (cached by every process for
+CACHE_TIME_POPULAR) and the cache warm-up (`python manage.py warm_cache`).
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+from rss.models import PopularQuery
+from rss.query_parser import DATE_RANGES
+
+logger = logging.getLogger(__name__)
+
+POPULAR_CACHE_KEY = "popular-searches"
+FILE_PREFIX = "queries-"
+FILE_SUFFIX = ".jsonl.gz"
+
+
+def normalize(q, sources=(), categories=(), date=""):
+    """Key of a query: case, spacing and filter order don't matter"""
+    return (
+        " ".join(q.lower().split())[:100],
+        tuple(sorted(set(sources))),
+        tuple(sorted(set(categories))),
+        date if date in DATE_RANGES else "",
+    )
+
+
+def search_url(key):
+    q, sources, categories, date = key
+    params = [("q", q)] + [("source", s) for s in sources]
+    params += [("category", c) for c in categories]
+    if date:
+        params.append(("date", date))
+    return "/search/?" + urlencode(params)
+
+
+def log_path(day):
+    return os.path.join(
+        settings.QUERY_LOG_DIR, "{}{}{}".format(FILE_PREFIX, day.isoformat(), FILE_SUFFIX)
+    )
+
+
+class QueryLog:
+    """In-memory buffer of query records, appended to the log in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+        self._flushed_at = time.monotonic()
+
+    def append(self, record):
+        with self._lock:
+            self._records.append(record)
+            due = (
+                len(self._records) >= settings.QUERY_LOG_BATCH_SIZE
+                or time.monotonic() - self._flushed_at > settings.QUERY_LOG_FLUSH_SECONDS
+            )
+            if not due:
+                return
+            batch = self._take()
+        threading.Thread(target=write_batch, args=(batch,), daemon=True).start()
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        write_batch(batch)
+
+    def _take(self):
+        batch, self._records = self._records, []
+        self._flushed_at = time.monotonic()
+        return batch
+
+
+def write_batch(batch, day=None):
+    if not batch:
+        return
+    day = day or datetime.now(timezone.utc).date()
+    data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch)
+    try:
+        os.makedirs(settings.QUERY_LOG_DIR, exist_ok=True)
+        fd = os.open(log_path(day), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, gzip.compress(data.encode("utf-8")))
+        finally:
+            os.close(fd)
+    except OSError:
+        logger.warning("Could not write %d query log records", len(batch), exc_info=True)
+
+
+query_log = QueryLog()
+atexit.register(query_log.flush)
+
+
+def record(request, response, metrics):
+    """Log the search served by `response`, called by InstrumentationMiddleware"""
+    if not settings.QUERY_LOG_DIR or response.status_code != 200:
+        return
+    if request.path not in settings.QUERY_LOG_ROUTES:
+        return
+    q, sources, categories, date = normalize(
+        request.GET.get("q", ""),
+        request.GET.getlist("source"),
+        request.GET.getlist("category"),
+        request.GET.get("date", ""),
+    )
+    query_log.append(
+        {
+            "ts": round(time.time(), 3),
+            "route": request.path,
+            "q": q,
+            "sources": sources,
+            "categories": categories,
+            "date": date,
+            "latency_ms": round((time.perf_counter() - metrics.started) * 1000, 1),
+            # Unknown when the page came from the cache
+            "hits": getattr(request, "_query_hits", None),
+            "cache_hit": metrics.cache_hit,
+        }
+    )
+
+
+def read_log(days, today=None):
+    """Records of the last `days` daily logs, oldest first"""
+    today = today or datetime.now(timezone.utc).date()
+    for offset in range(days - 1, -1, -1):
+        path = log_path(today - timedelta(days=offset))
+        if not os.path.exists(path):
+            continue
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError):
+            # A batch being appended right now, or a truncated file
+            logger.warning("Could not read the end of %s", path, exc_info=True)
+
+
+def delete_old_logs(days, today=None):
+    today = today or datetime.now(timezone.utc).date()
+    oldest = log_path(today - timedelta(days=days - 1))
+    deleted = 0
+    if not os.path.isdir(settings.QUERY_LOG_DIR):
+        return deleted
+    for name in os.listdir(settings.QUERY_LOG_DIR):
+        path = os.path.join(settings.QUERY_LOG_DIR, name)
+        if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX) and path < oldest:
+            os.remove(path)
+            deleted += 1
+    return deleted
+
+
+class CountMinSketch:
+    """Approximate per-key sums in fixed memory, never under-estimated"""
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("d", bytes(8 * width)) for _ in range(depth)]
+
+    def indexes(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key, value=1.0, indexes=None):
+        """Add `value` to `key`; pass `indexes(key)` to skip hashing again"""
+        for row, i in zip(self.rows, indexes or self.indexes(key)):
+            row[i] += value
+
+    def estimate(self, key, indexes=None):
+        return min(row[i] for row, i in zip(self.rows, indexes or self.indexes(key)))
+
+
+class HeavyHitters:
+    """The `k` keys with the highest count-min estimates seen in a stream"""
+
+    def __init__(self, k):
+        self.k = k
+        self.candidates = {}
+
+    def offer(self, key, estimate):
+        self.candidates[key] = estimate
+        # Prune in batches, so that each offer is O(1) amortized
+        if len(self.candidates) > 2 * self.k:
+            self.candidates = dict(self.top())
+
+    def top(self):
+        return sorted(self.candidates.items(), key=lambda kv: -kv[1])[: self.k]
+
+
+class QueryStats:
+    """Streaming aggregation of query log records"""
+
+    def __init__(self, k, width=4096, depth=4):
+        self.counts = CountMinSketch(width, depth)
+        self.latency = CountMinSketch(width, depth)
+        self.cache_hits = CountMinSketch(width, depth)
+        self.empty = CountMinSketch(width, depth)
+        self.heavy = HeavyHitters(k)
+        self.records = 0
+
+    def add(self, rec):
+        key = normalize(
+            rec.get("q", ""), rec.get("sources", ()), rec.get("categories", ()), rec.get("date", "")
+        )
+        name = json.dumps(key)
+        indexes = self.counts.indexes(name)
+        self.counts.add(name, 1, indexes)
+        self.latency.add(name, rec.get("latency_ms") or 0, indexes)
+        if rec.get("cache_hit"):
+            self.cache_hits.add(name, 1, indexes)
+        if rec.get("hits") == 0:
+            self.empty.add(name, 1, indexes)
+        self.heavy.offer(name, self.counts.estimate(name, indexes))
+        self.records += 1
+
+    def top(self):
+        """`[(key, count, avg latency ms, cache hit ratio, empty ratio)]`, busiest first"""
+        result = []
+        for name, count in self.heavy.top():
+            indexes = self.counts.indexes(name)
+            q, sources, categories, date = json.loads(name)
+            result.append(
+                (
+                    (q, tuple(sources), tuple(categories), date),
+                    int(count),
+                    self.latency.estimate(name, indexes) / count,
+                    min(self.cache_hits.estimate(name, indexes) / count, 1.0),
+                    min(self.empty.estimate(name, indexes) / count, 1.0),
+                )
+            )
+        return result
+
+
+def aggregate(days=None, k=None):
+    days = days or settings.QUERY_LOG_WINDOW_DAYS
+    stats = QueryStats(k or settings.QUERY_LOG_TOP)
+    for rec in read_log(days):
+        stats.add(rec)
+    return stats
+
+
+def save_popular(stats):
+    """Replace the PopularQuery rows with the heaviest queries of `stats`"""
+    rows = [
+        PopularQuery(
+            rank=rank,
+            q=key[0],
+            sources="\n".join(key[1]),
+            categories="\n".join(key[2]),
+            date=key[3],
+            count=count,
+            avg_latency_ms=latency,
+            cache_hit_ratio=cache_hit_ratio,
+            empty_ratio=empty_ratio,
+        )
+        for rank, (key, count, latency, cache_hit_ratio, empty_ratio) in enumerate(stats.top(), 1)
+    ]
+    with transaction.atomic():
+        PopularQuery.objects.all().delete()
+        PopularQuery.objects.bulk_create(rows)
+    return rows
+
+
+def _load_popular():
+    rows = PopularQuery.objects.filter(
+        sources="", categories="", date="", count__gte=settings.QUERY_POPULAR_MIN_COUNT
+    ).exclude(q="")
+    # Searches that mostly find nothing are not worth suggesting
+    rows = rows.filter(empty_ratio__lt=0.5).order_by("rank")[: settings.QUERY_POPULAR_SIZE]
+    return [{"name": row.q, "search": row.q} for row in rows]
+
+
+def popular_searches():
+    """POPULAR list from the last aggregation, settings.POPULAR until there is one"""
+    popular = cache.get(POPULAR_CACHE_KEY)
+    if popular is None:
+        try:
+            popular = _load_popular()
+        except DatabaseError:
+            logger.warning("Could not load popular searches", exc_info=True)
+            popular = []
+        cache.set(POPULAR_CACHE_KEY, popular, settings.CACHE_TIME_POPULAR)
+    return popular or settings.POPULAR
@@ -0,0 +1,79 @@
+"""
+Related jobs for the job detail page
+
+The ids of the jobs most similar to a document (`more_like_this` over its
+title and body) are computed on the first view and kept in the cache for
+CACHE_TIME_RELATED seconds, much shorter than the week the detail page itself
+is cached for.
+
+The panel is served as a separate fragment (/related/?id=...) loaded by the
+page, so refreshing it never busts the cached detail page. The rendered panel
+is page-cached for CACHE_TIME_JOBS seconds like the job lists, so the
+multi-get hydrating the ids only runs when it is rebuilt.
+
+Usage:
+    hits = related_jobs(doc_id)
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+from elasticsearch_dsl.response import Hit
+
+from rss.instrumentation import registry
+
+# Fields returned when hydrating related jobs, enough for a card
+CARD_FIELDS = ["title", "pubDate", "source", "category"]
+
+
+def _cache_key(doc_id):
+    return "related:{}".format(hashlib.sha1(doc_id.encode("utf-8")).hexdigest())
+
+
+def compute_related_ids(doc_id, size=None):
+    """Ids of the jobs most similar to `doc_id`, best first"""
+    query = Search(index="rss").update_from_dict(
+        {
+            "size": size or settings.RELATED_JOBS_COUNT,
+            "_source": False,
+            "query": {
+                "more_like_this": {
+                    "fields": ["title", "body"],
+                    "like": [{"_index": "rss", "_id": doc_id}],
+                    "min_term_freq": 1,
+                    "min_doc_freq": 2,
+                    "max_query_terms": 25,
+                }
+            },
+        }
+    )
+    return [hit.meta.id for hit in query.execute().hits]
+
+
+def related_ids(doc_id):
+    key = _cache_key(doc_id)
+    ids = cache.get(key)
+    registry.inc(
+        "junojobs_related_cache_total",
+        {"result": "miss" if ids is None else "hit"},
+        help="Related job id list cache lookups",
+    )
+    if ids is None:
+        ids = compute_related_ids(doc_id)
+        cache.set(key, ids, settings.CACHE_TIME_RELATED)
+    return ids
+
+
+def related_jobs(doc_id):
+    """Related jobs as search hits, hydrated with a single multi-get"""
+    ids = related_ids(doc_id)
+    if not ids:
+        return []
+    res = connections.get_connection().mget(
+        body={"ids": ids}, index="rss", _source_includes=CARD_FIELDS
+    )
+    # Jobs deleted since the ids were computed are skipped
+    return [Hit(doc) for doc in res["docs"] if doc.get("found")]
@@ -3,6 +3,8 @@ from django.urls import reverse
 from elasticsearch_dsl import Search
 from datetime import datetime, timedelta
 
+from rss.admission import Overloaded
+
 
 class JobSitemap(Sitemap):
     """Sitemap for recent job listings."""
@@ -39,6 +41,8 @@ class JobSitemap(Sitemap):
                 }
                 for hit in res.hits
             ]
+        except Overloaded:
+            raise
         except Exception as e:
             print(f"Error fetching jobs for sitemap: {e}")
             return []
@@ -0,0 +1,323 @@
+"""
+Export and import of the rss index as compressed NDJSON snapshots
+
+    python manage.py export_index snapshots/2026-10-19 --workers 8
+    python manage.py import_index snapshots/2026-10-19 --workers 8
+
+A snapshot is a directory holding one shard file per scroll slice, such as
+`rss-0003-of-0008.ndjson.gz` (`.zst` with `--compression zstd`, which needs
+the `zstandard` package), with one `{"_id": ..., "_source": ...}` line per
+job, and a `manifest.json` with the index mapping and the number of jobs of
+every finished shard.
+
+Export reads the index with a sliced scroll, one slice per worker. Shards
+are written to a `.part` file and renamed when complete, and the manifest is
+updated as each shard completes, so running an interrupted export again only
+redoes the unfinished shards.
+
+Import reads the shards in parallel and indexes them with `streaming_bulk`.
+The number of jobs acknowledged for every shard, and the lines of the jobs
+Elasticsearch refused, are checkpointed in `import-checkpoint.json`, so
+running an interrupted import again resumes after the last acknowledged chunk
+and retries the refused jobs. An import that leaves refused jobs behind fails
+with a SnapshotError. Refreshes are disabled while importing.
+"""
+
+import collections
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import elasticsearch
+from elasticsearch import helpers
+
+from rss.progress import Progress
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+MANIFEST = "manifest.json"
+CHECKPOINT = "import-checkpoint.json"
+SCROLL_KEEP_ALIVE = "5m"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def shard_name(index, shard, shards, compression):
+    return "{}-{:04d}-of-{:04d}.ndjson{}".format(index, shard, shards, COMPRESSIONS[compression])
+
+
+def open_shard(path, mode, compression):
+    """Text stream on a shard file, `mode` is "r" or "w" """
+    if compression == "zstd":
+        if zstandard is None:
+            raise SnapshotError("zstd compression needs the zstandard package")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def export_index(es, directory, index="rss", workers=4, compression="gzip", page_size=1000,
+                 progress=None):
+    """Write `index` to `directory`, one shard per worker; returns the manifest"""
+    if compression not in COMPRESSIONS:
+        raise SnapshotError("unknown compression {!r}".format(compression))
+    if compression == "zstd" and zstandard is None:
+        raise SnapshotError("zstd compression needs the zstandard package")
+    progress = progress or Progress()
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+
+    manifest = _read_json(manifest_path)
+    if manifest is None:
+        mappings = es.indices.get_mapping(index=index)
+        manifest = {
+            "index": index,
+            "shards": workers,
+            "compression": compression,
+            "created": datetime.now(timezone.utc).isoformat(),
+            # Keyed by the concrete index name when `index` is an alias
+            "mappings": next(iter(mappings.values()))["mappings"],
+            "done": {},
+        }
+        _write_json(manifest_path, manifest)
+    elif (manifest["index"], manifest["shards"], manifest["compression"]) != (
+        index,
+        workers,
+        compression,
+    ):
+        raise SnapshotError(
+            "{} holds an export of {} in {} {} shards, resume it with the same options".format(
+                directory, manifest["index"], manifest["shards"], manifest["compression"]
+            )
+        )
+
+    todo = [shard for shard in range(workers) if str(shard) not in manifest["done"]]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                _export_slice,
+                es,
+                index,
+                shard,
+                workers,
+                os.path.join(directory, shard_name(index, shard, workers, compression)),
+                compression,
+                page_size,
+                progress,
+            ): shard
+            for shard in todo
+        }
+        # Only this thread updates the manifest
+        for future in as_completed(futures):
+            manifest["done"][str(futures[future])] = future.result()
+            _write_json(manifest_path, manifest)
+    return manifest
+
+
+def _export_slice(es, index, shard, shards, path, compression, page_size, progress):
+    body = {"size": page_size, "sort": ["_doc"]}
+    if shards > 1:
+        body["slice"] = {"id": shard, "max": shards}
+    tmp = path + ".part"
+    count = 0
+    res = es.search(index=index, body=body, scroll=SCROLL_KEEP_ALIVE)
+    scroll_id = res.get("_scroll_id")
+    try:
+        with open_shard(tmp, "w", compression) as f:
+            while res["hits"]["hits"]:
+                hits = res["hits"]["hits"]
+                data = "".join(
+                    json.dumps({"_id": hit["_id"], "_source": hit["_source"]}, separators=(",", ":"))
+                    + "\n"
+                    for hit in hits
+                )
+                f.write(data)
+                count += len(hits)
+                progress.add(len(hits), len(data))
+                res = es.scroll(scroll_id=scroll_id, scroll=SCROLL_KEEP_ALIVE)
+                scroll_id = res.get("_scroll_id", scroll_id)
+    finally:
+        if scroll_id:
+            try:
+                es.clear_scroll(scroll_id=scroll_id)
+            except elasticsearch.TransportError:
+                logger.warning("Could not clear the scroll of shard %d", shard, exc_info=True)
+    os.replace(tmp, path)
+    return count
+
+
+class Checkpoint:
+    """
+    Number of jobs acknowledged per shard, and line numbers of the jobs that
+    were refused and must be retried, saved after every chunk
+    """
+
+    def __init__(self, path, offsets=None, failed=None):
+        self.path = path
+        self.offsets = dict(offsets or {})
+        self.failed = {name: list(lines) for name, lines in (failed or {}).items()}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        data = _read_json(path) or {}
+        return cls(path, data.get("offsets"), data.get("failed"))
+
+    def get(self, name):
+        """`(offset, lines to retry)` of a shard"""
+        return self.offsets.get(name, 0), set(self.failed.get(name, ()))
+
+    def update(self, name, offset, failed):
+        with self._lock:
+            self.offsets[name] = offset
+            if failed:
+                self.failed[name] = sorted(failed)
+            else:
+                self.failed.pop(name, None)
+            _write_json(self.path, {"offsets": self.offsets, "failed": self.failed})
+
+    def failures(self):
+        return sum(len(lines) for lines in self.failed.values())
+
+
+@contextmanager
+def bulk_settings(es, index):
+    """Disable refreshes of `index` while in the block"""
+    try:
+        current = es.indices.get_settings(index=index, name="index.refresh_interval")
+        previous = next(iter(current.values()))["settings"].get("index", {}).get("refresh_interval")
+        es.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1"}})
+    except elasticsearch.TransportError:
+        # Hosted plans may not allow it, the import is only slower
+        logger.warning("Could not disable refreshes of %s", index, exc_info=True)
+        yield
+        return
+    try:
+        yield
+    finally:
+        es.indices.put_settings(index=index, body={"index": {"refresh_interval": previous}})
+
+
+def import_index(es, directory, index=None, workers=4, chunk_size=1000, op_type="index",
+                 restart=False, progress=None):
+    """Index every finished shard of the snapshot in `directory`"""
+    manifest = _read_json(os.path.join(directory, MANIFEST))
+    if manifest is None:
+        raise SnapshotError("no {} in {}".format(MANIFEST, directory))
+    progress = progress or Progress()
+    index = index or manifest["index"]
+    if not es.indices.exists(index=index):
+        es.indices.create(index=index, body={"mappings": manifest["mappings"]})
+
+    checkpoint_path = os.path.join(directory, CHECKPOINT)
+    checkpoint = Checkpoint(checkpoint_path) if restart else Checkpoint.load(checkpoint_path)
+    names = [
+        shard_name(manifest["index"], int(shard), manifest["shards"], manifest["compression"])
+        for shard in sorted(manifest["done"], key=int)
+    ]
+    with bulk_settings(es, index), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _import_shard,
+                es,
+                index,
+                os.path.join(directory, name),
+                manifest["compression"],
+                checkpoint,
+                chunk_size,
+                op_type,
+                progress,
+            )
+            for name in names
+        ]
+        for future in as_completed(futures):
+            future.result()
+    es.indices.refresh(index=index)
+    failures = checkpoint.failures()
+    if failures:
+        raise SnapshotError(
+            "{} jobs could not be imported, run the import again to retry them".format(failures)
+        )
+    return progress
+
+
+def _import_shard(es, index, path, compression, checkpoint, chunk_size, op_type, progress):
+    name = os.path.basename(path)
+    offset, retry = checkpoint.get(name)
+    failed = set(retry)
+
+    with open_shard(path, "r", compression) as f:
+        nbytes = 0
+        # Line number of every action sent, results come back in the same order
+        sent = collections.deque()
+
+        def actions():
+            nonlocal nbytes
+            for number, line in enumerate(f):
+                if number < offset and number not in retry:
+                    continue
+                nbytes += len(line)
+                doc = json.loads(line)
+                sent.append(number)
+                yield {
+                    "_op_type": op_type,
+                    "_index": index,
+                    "_id": doc["_id"],
+                    "_source": doc["_source"],
+                }
+
+        done = offset
+        docs = errors = 0
+        for ok, item in helpers.streaming_bulk(
+            es, actions(), chunk_size=chunk_size, max_retries=3, raise_on_error=False
+        ):
+            number = sent.popleft()
+            done = max(done, number + 1)
+            docs += 1
+            # With "create", jobs already in the index are expected
+            if ok or item.get(op_type, {}).get("status") == 409:
+                failed.discard(number)
+            else:
+                errors += 1
+                if len(failed) < 5:
+                    logger.warning("Could not import a job of %s: %s", name, item)
+                failed.add(number)
+            if docs == chunk_size:
+                checkpoint.update(name, done, failed)
+                progress.add(docs, nbytes, errors)
+                docs = nbytes = errors = 0
+        checkpoint.update(name, done, failed)
+        progress.add(docs, nbytes, errors)
@@ -1,23 +1,182 @@
+"""
+Registry of the job sources listed in node/sources.json
+
+The registry is loaded once from SOURCES_PATH and never modified. Sources
+are indexed by name, feed URL and netloc:
+
+    registry.get("RemoteOk")
+    sources_has_netloc("remoteok.com")
+
+Per-source runtime stats (number of jobs, newest `pubDate`, last successful
+fetch recorded by node/ingest.js) are refreshed in a background thread every
+SOURCE_STATS_REFRESH_SECONDS, so requests never wait on Elasticsearch:
+
+    stats = registry.stats()  # {name: SourceStats}, empty until first loaded
+"""
+
 import json
-import os
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Optional
 from urllib.parse import urlparse
 
+from dateutil import parser as date_parser
+from django.conf import settings
+from elasticsearch_dsl import Search
 
-filepath = os.path.abspath('./node/sources.json')
+from rss import generation
 
-with open(filepath, 'r') as f:
-    sources = json.load(f)
+logger = logging.getLogger(__name__)
 
+# Index where node/ingest.js records the last successful fetch of every source
+FETCH_INDEX = "rss-sources"
 
-def sources_has_url(url):
-    for source in sources:
-        if source['url'] == url:
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    url: str
+    category: Optional[str] = None
+    show_in_homepage: bool = True
+    # Entry as written in sources.json, read-only
+    raw: MappingProxyType = field(
+        default_factory=lambda: MappingProxyType({}), repr=False, compare=False
+    )
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(
+            name=entry["name"],
+            url=entry["url"],
+            category=entry.get("category"),
+            show_in_homepage=entry.get("show_in_homepage", True),
+            raw=MappingProxyType(dict(entry)),
+        )
+
+    @property
+    def netloc(self):
+        return urlparse(self.url).netloc
+
+    def to_dict(self):
+        return dict(self.raw)
+
+
+@dataclass(frozen=True)
+class SourceStats:
+    doc_count: int = 0
+    newest: Optional[datetime] = None
+    last_fetch: Optional[datetime] = None
+
+
+class SourceRegistry:
+    """Immutable list of sources with O(1) lookups and background stats"""
+
+    def __init__(self, entries):
+        self.sources = tuple(Source.from_dict(entry) for entry in entries)
+        self._by_name = {source.name: source for source in self.sources}
+        self._by_url = {source.url: source for source in self.sources}
+        by_netloc = {}
+        for source in self.sources:
+            by_netloc.setdefault(source.netloc, []).append(source)
+        self._by_netloc = {netloc: tuple(s) for netloc, s in by_netloc.items()}
+
+        self._stats = {}
+        self._stats_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def by_url(self, url):
+        return self._by_url.get(url)
+
+    def by_netloc(self, netloc):
+        return self._by_netloc.get(netloc, ())
+
+    def to_json(self, **kwargs):
+        return json.dumps([source.to_dict() for source in self.sources], **kwargs)
+
+    def stats(self) -> Dict[str, SourceStats]:
+        """Latest stats snapshot, scheduling a background refresh when stale"""
+        with self._lock:
+            stale = (
+                self._stats_at is None
+                or time.monotonic() - self._stats_at > settings.SOURCE_STATS_REFRESH_SECONDS
+            )
+            if stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_stats, daemon=True).start()
+            return self._stats
+
+    def has_jobs(self, name):
+        """False only when the stats are loaded and the source has no job"""
+        stats = self.stats()
+        if not stats:
             return True
+        return name in stats and stats[name].doc_count > 0
 
+    def _refresh_stats(self):
+        try:
+            stats = fetch_stats(self.sources)
+        except Exception:
+            logger.warning("Could not refresh source stats", exc_info=True)
+            stats = None
+        with self._lock:
+            if stats is not None:
+                self._stats = stats
+            self._stats_at = time.monotonic()
+            self._refreshing = False
 
-def sources_has_netloc(netloc):
+
+def _last_fetches():
+    query = Search(index=FETCH_INDEX).params(ignore_unavailable=True)
+    query = query.update_from_dict({"size": 1000, "_source": ["lastFetch"]})
+    return {
+        hit.meta.id: date_parser.parse(hit.lastFetch)
+        for hit in query.execute().hits
+        if getattr(hit, "lastFetch", None)
+    }
+
+
+def fetch_stats(sources):
+    """Stats of every source, None when the index generation can't be read"""
+    # Same aggregation as the index generation, shared through its cache
+    current = generation.current()
+    if current is None:
+        return None
+    counts = current.sources
+    last_fetches = _last_fetches()
+    stats = {}
     for source in sources:
-        parsed = urlparse(source['url'])
-        if parsed.netloc == netloc:
-            return True
-    return False
+        doc_count, newest = counts.get(source.name, (0, None))
+        stats[source.name] = SourceStats(doc_count, newest, last_fetches.get(source.name))
+    return MappingProxyType(stats)
+
+
+# Singleton instance
+registry = SourceRegistry.load(settings.SOURCES_PATH)
+sources = registry.sources
+
+
+def sources_has_url(url):
+    return registry.by_url(url) is not None
+
+
+def sources_has_netloc(netloc):
+    return bool(registry.by_netloc(netloc))
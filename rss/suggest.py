@@ -0,0 +1,166 @@
+"""
+Type-ahead suggestions for the search bar
+
+Suggestions are answered from an in-process prefix index built from the
+SmartQueryParser vocabularies, the source names and the most frequent terms
+in recent job titles. The index is rebuilt in a background thread once it is
+older than SUGGEST_REFRESH_SECONDS, so requests never wait on Elasticsearch.
+
+Usage:
+    suggest("senior py")  # ['senior python', 'senior pytorch', ...]
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from elasticsearch_dsl import Search
+
+from rss.query_parser import SmartQueryParser
+from rss.sources import sources
+
+logger = logging.getLogger(__name__)
+
+# Prefixes up to this length have their top completions precomputed, longer
+# prefixes select from a bisected range which is small by then
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+WORD_RE = re.compile(r"[a-z][a-z0-9+#.\-]{2,}")
+
+
+class PrefixIndex:
+    """Immutable sorted term list answering top-k prefix lookups"""
+
+    def __init__(self, weights, k=10):
+        self.k = k
+        items = sorted(weights.items())
+        self.terms = [term for term, _ in items]
+        self.weights = [weight for _, weight in items]
+        self._top = {}
+        for term, weight in items:
+            for n in range(1, min(len(term), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                heap = self._top.setdefault(term[:n], [])
+                if len(heap) < k:
+                    heapq.heappush(heap, (weight, term))
+                elif weight > heap[0][0]:
+                    heapq.heapreplace(heap, (weight, term))
+        for prefix, heap in self._top.items():
+            self._top[prefix] = [term for _, term in sorted(heap, key=_rank)]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def complete(self, prefix, k=None):
+        k = min(k or self.k, self.k)
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return self._top.get(prefix, [])[:k]
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + "\uffff", lo)
+        best = heapq.nlargest(k, zip(self.weights[lo:hi], self.terms[lo:hi]))
+        return [term for _, term in sorted(best, key=_rank)]
+
+
+def _rank(item):
+    weight, term = item
+    return (-weight, term)
+
+
+def vocabulary_weights():
+    """Base weights for parser vocabularies and source names"""
+    weights = {}
+    for vocabulary in (
+        SmartQueryParser.SKILLS,
+        SmartQueryParser.LOCATION_KEYWORDS,
+        SmartQueryParser.SENIORITY_LEVELS,
+    ):
+        for term in vocabulary:
+            weights[term] = 10
+    for source in sources:
+        weights[source.name.lower()] = 5
+    return weights
+
+
+def title_term_counts(sample_size, top_n):
+    """Most frequent words in the titles of the latest `sample_size` jobs"""
+    query = Search(index="rss").update_from_dict(
+        {
+            "size": sample_size,
+            "_source": ["title"],
+            "sort": [{"pubDate": {"order": "desc", "unmapped_type": "date"}}],
+        }
+    )
+    counts = Counter()
+    for hit in query.execute().hits:
+        words = set(WORD_RE.findall((getattr(hit, "title", "") or "").lower()))
+        counts.update(words - SmartQueryParser.STOP_WORDS)
+    return dict(counts.most_common(top_n))
+
+
+def build_index(with_titles=True):
+    weights = vocabulary_weights()
+    if with_titles:
+        counts = title_term_counts(
+            settings.SUGGEST_TITLE_SAMPLE, settings.SUGGEST_TITLE_TERMS
+        )
+        for term, count in counts.items():
+            weights[term] = weights.get(term, 0) + count
+    return PrefixIndex(weights, k=settings.SUGGEST_MAX_RESULTS)
+
+
+class _State:
+    index = None
+    built_at = None
+    refreshing = False
+    lock = threading.Lock()
+
+
+def _refresh():
+    try:
+        index = build_index()
+    except Exception:
+        logger.warning("Could not refresh suggestion index", exc_info=True)
+        index = None
+    with _State.lock:
+        if index is not None:
+            _State.index = index
+        _State.built_at = time.monotonic()
+        _State.refreshing = False
+
+
+def get_index():
+    """Current prefix index, scheduling a background refresh when stale"""
+    with _State.lock:
+        if _State.index is None:
+            # Serve the vocabularies right away, titles are added by the refresh
+            _State.index = build_index(with_titles=False)
+        stale = (
+            _State.built_at is None
+            or time.monotonic() - _State.built_at > settings.SUGGEST_REFRESH_SECONDS
+        )
+        if stale and not _State.refreshing:
+            _State.refreshing = True
+            threading.Thread(target=_refresh, daemon=True).start()
+        return _State.index
+
+
+def suggest(query, k=None):
+    """Complete the whole query, then its last word keeping the words before it"""
+    query = " ".join(query.lower().split())
+    if not query:
+        return []
+    index = get_index()
+    results = index.complete(query, k)
+    head, _, last = query.rpartition(" ")
+    if head and len(results) < (k or index.k):
+        for term in index.complete(last, k):
+            completion = "{} {}".format(head, term)
+            if completion not in results:
+                results.append(completion)
+    return results[: k or index.k]
@@ -1,3 +1,937 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+import elasticsearch
+from elasticsearch import Transport
+from elasticsearch_dsl.connections import connections
+
+from rss import admission, api, generation, snapshots
+from rss.admission import Overloaded, TokenBucket, validate
+from rss.alerts import AlertMatcher, run_alerts
+from rss.api import BadRequest, decode_cursor, encode_cursor
+from rss.benchmarks.corpus import generate_corpus
+from rss.benchmarks.fake_es import FakeConnection
+from rss.entities import FIELDS as ENTITY_FIELDS, extract, tokenize
+from rss.instrumentation import InstrumentedTransport, MetricsRegistry
+from rss.models import SavedSearch
+from rss.page_cache import accepted_encodings, compress, negotiate
+from rss.query_cost import FIELDS, SIMPLE_FLAGS, analyze
+from rss.query_parser import build_search_query
+from rss.querylog import CountMinSketch, HeavyHitters, QueryStats
+from rss.sources import Source, fetch_stats
+from rss.sources import registry as source_registry
+from rss.suggest import PrefixIndex, suggest
+from rss.views import create_index_if_not_exists
+
+LOCMEM = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+    for alias in settings.CACHES
+}
+# Sized like production, the default cache keeps Django's 300 entries
+LOCMEM["cards"]["OPTIONS"] = {"MAX_ENTRIES": 20000}
+# What DEBUG runs with
+DUMMY = {
+    alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"} for alias in settings.CACHES
+}
+# The manifest storage needs collectstatic
+STATIC = "django.contrib.staticfiles.storage.StaticFilesStorage"
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def use_fake_es(size=200):
+    """Serve Elasticsearch requests from the benchmark stand-in; returns the corpus"""
+    corpus = generate_corpus(size)
+    FakeConnection.load(corpus)
+    connections.create_connection(
+        hosts=["fake"], connection_class=FakeConnection, transport_class=InstrumentedTransport
+    )
+    return corpus
+
+
+@override_settings(CACHES=LOCMEM, STATICFILES_STORAGE=STATIC)
+class ConditionalPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.corpus = use_fake_es()
+
+    def setUp(self):
+        clear_caches()
+
+    def assertRevalidates(self, url):
+        miss = self.client.get(url)
+        hit = self.client.get(url)
+        self.assertEqual(miss.status_code, 200)
+        self.assertEqual(hit.status_code, 200)
+        self.assertNotIn("es;", hit["Server-Timing"])
+        self.assertEqual(hit["ETag"], miss["ETag"])
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=miss["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_jobs(self):
+        self.assertRevalidates("/jobs/")
+
+    def test_job(self):
+        self.assertRevalidates("/job/?id=" + quote(self.corpus[0][0], safe=""))
+
+    def test_compressed_job(self):
+        url = "/job/?id=" + quote(self.corpus[1][0], safe="")
+        miss = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        hit = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(hit["Content-Encoding"], "gzip")
+        self.assertEqual(hit["ETag"], miss["ETag"])
+        revalidated = self.client.get(
+            url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=miss["ETag"]
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_related_panel(self):
+        url = "/related/?id=" + quote(self.corpus[2][0], safe="")
+        miss = self.client.get(url)
+        hit = self.client.get(url)
+        self.assertIn("es;", miss["Server-Timing"])
+        self.assertNotIn("es;", hit["Server-Timing"])
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(miss["Cache-Control"], "max-age={}".format(settings.CACHE_TIME_JOBS))
+        self.assertEqual(hit["Cache-Control"], "max-age={}".format(settings.CACHE_TIME_JOBS))
+
+    def test_headers_without_cache(self):
+        url = "/related/?id=" + quote(self.corpus[3][0], safe="")
+        with self.settings(CACHES=DUMMY):
+            response = self.client.get(url)
+        self.assertEqual(response["Cache-Control"], "max-age={}".format(settings.CACHE_TIME_JOBS))
+        self.assertTrue(response.has_header("Expires"))
+
+
+class EncodingNegotiationTests(SimpleTestCase):
+    def test_accepted_encodings(self):
+        for header, expected in [
+            (None, {}),
+            ("", {}),
+            ("gzip", {"gzip": 1.0}),
+            ("br, GZIP;q=0.5", {"br": 1.0, "gzip": 0.5}),
+            ("gzip ; q = 0.8, *;q=0.1", {"gzip": 0.8, "*": 0.1}),
+            ("gzip;q=1.2.3, br", {"br": 1.0}),
+            (", ;q=1", {}),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(accepted_encodings(header), expected)
+
+    def test_negotiate(self):
+        both = {"br": b"", "gzip": b""}
+        for header, available, expected in [
+            (None, both, None),
+            ("identity", both, None),
+            ("deflate", both, None),
+            ("gzip, br", both, "br"),
+            ("gzip", both, "gzip"),
+            ("br;q=0.5, gzip", both, "gzip"),
+            ("br, gzip", {"gzip": b""}, "gzip"),
+            ("gzip;q=0, br;q=0", both, None),
+            ("*", both, "br"),
+            ("*;q=0.5, gzip", both, "gzip"),
+            ("gzip", {"identity": b""}, None),
+        ]:
+            with self.subTest(header=header, available=sorted(available)):
+                self.assertEqual(negotiate(header, available), expected)
+
+    def test_compress(self):
+        small = b"<p>small</p>"
+        self.assertEqual(compress(small), {"identity": small})
+        content = b"<p>job</p>" * 100
+        variants = compress(content)
+        self.assertEqual(gzip.decompress(variants["gzip"]), content)
+
+
+def zipf_stream(keys=200, records=5000):
+    """Deterministic skewed stream: key i is about 1/(i+1) as frequent as key 0"""
+    weights = [1 / (i + 1) for i in range(keys)]
+    scale = records / sum(weights)
+    counts = {"q{}".format(i): max(int(w * scale), 1) for i, w in enumerate(weights)}
+    stream = [key for key, count in counts.items() for _ in range(count)]
+    return counts, stream[::2] + stream[1::2]
+
+
+class QueryStatsTests(SimpleTestCase):
+    def test_sketch_is_exact_without_collisions(self):
+        sketch = CountMinSketch(width=4096, depth=4)
+        for key, value in [("a", 1), ("b", 2.5), ("a", 3)]:
+            sketch.add(key, value)
+        self.assertEqual(sketch.estimate("a"), 4)
+        self.assertEqual(sketch.estimate("b"), 2.5)
+        self.assertEqual(sketch.estimate("never seen"), 0)
+
+    def test_sketch_never_under_estimates(self):
+        counts, stream = zipf_stream()
+        sketch = CountMinSketch(width=32, depth=4)
+        for key in stream:
+            sketch.add(key)
+        for key, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(key), count, key)
+
+    def test_heavy_hitters(self):
+        counts, stream = zipf_stream()
+        sketch = CountMinSketch()
+        heavy = HeavyHitters(5)
+        for key in stream:
+            sketch.add(key)
+            heavy.offer(key, sketch.estimate(key))
+            self.assertLessEqual(len(heavy.candidates), 10)
+        top = heavy.top()
+        self.assertEqual([key for key, _ in top], ["q0", "q1", "q2", "q3", "q4"])
+        self.assertEqual(dict(top), {key: counts[key] for key, _ in top})
+
+    def test_query_stats(self):
+        stats = QueryStats(k=2)
+        records = [
+            {"q": "Python  Remote", "sources": ["b", "a"], "latency_ms": 10, "hits": 5},
+            {"q": "python remote", "sources": ["a", "b"], "latency_ms": 30, "cache_hit": True, "hits": 5},
+            {"q": "rust", "latency_ms": 50, "hits": 0},
+        ]
+        for rec in records:
+            stats.add(rec)
+        self.assertEqual(
+            stats.top(),
+            [
+                (("python remote", ("a", "b"), (), ""), 2, 20.0, 0.5, 0.0),
+                (("rust", (), (), ""), 1, 50.0, 0.0, 1.0),
+            ],
+        )
+
+
+class QueryCostTests(SimpleTestCase):
+    def test_analyze(self):
+        many = " OR ".join("w{}".format(i) for i in range(settings.QUERY_MAX_CLAUSES + 8))
+        for query, plan, reasons in [
+            ("python remote", "query_string", ()),
+            ("py* AND (remote OR hybrid)", "query_string", ()),
+            ("title:python", "query_string", ()),
+            ("title:(python OR go)", "query_string", ()),
+            ('"python remote"~2', "query_string", ()),
+            ("pyth~2", "query_string", ()),
+            ("pyth*", "query_string", ()),
+            ("*script", "simple_query_string", ("leading_wildcard",)),
+            ("python ?ava", "simple_query_string", ("leading_wildcard",)),
+            ("/jav.*/", "simple_query_string", ("regex",)),
+            ("title:[a TO z]", "simple_query_string", ("range",)),
+            ("pubDate:>2020", "simple_query_string", ("field", "range")),
+            ("pyth*~2", "simple_query_string", ("fuzzy",)),
+            ("p*", "simple_query_string", ("expansion",)),
+            ("((python)", "simple_query_string", ("syntax",)),
+            ("python)", "simple_query_string", ("syntax",)),
+            ('"senior python', "simple_query_string", ("syntax",)),
+            ("salary:100", "simple_query_string", ("field",)),
+            (many, "match", ()),
+            ("((((((python))))))", "match", ()),
+        ]:
+            with self.subTest(query=query):
+                cost = analyze(query)
+                self.assertEqual(cost.plan, plan)
+                self.assertEqual(cost.reasons, reasons)
+                self.assertFalse(cost.rejected())
+
+    def test_rejected(self):
+        query = " ".join("w{}".format(i) for i in range(settings.QUERY_REJECT_CLAUSES + 1))
+        self.assertTrue(analyze(query).rejected())
+        with self.settings(STATICFILES_STORAGE=STATIC):
+            response = self.client.get("/search/", {"q": query})
+        self.assertEqual(response.status_code, 400)
+
+    def test_guard(self):
+        # Only queries without entities or words of 3+ characters reach the guard
+        self.assertEqual(
+            build_search_query("qa js")["query_string"],
+            {
+                "fields": FIELDS,
+                "query": "qa js",
+                "default_operator": "AND",
+                "allow_leading_wildcard": False,
+                "fuzzy_max_expansions": 50,
+                "rewrite": "top_terms_{}".format(settings.QUERY_MAX_EXPANSIONS),
+            },
+        )
+        for query in ["c*", "?a", "/a/", "a* OR b*"]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    build_search_query(query),
+                    {
+                        "simple_query_string": {
+                            "fields": FIELDS,
+                            "query": query,
+                            "default_operator": "and",
+                            "flags": SIMPLE_FLAGS,
+                        }
+                    },
+                )
+        self.assertEqual(
+            build_search_query("( ( ( ( ( ux ) ) ) ) )"),
+            {"multi_match": {"query": "ux", "fields": FIELDS, "operator": "and"}},
+        )
+
+    def test_guard_too_many_clauses(self):
+        words = [c + d for c in "bdhk" for d in "0123456789"]
+        self.assertGreater(len(words), settings.QUERY_MAX_CLAUSES)
+        for query, operator in [(" OR ".join(words), "or"), (" AND ".join(words), "and")]:
+            with self.subTest(operator=operator):
+                self.assertEqual(
+                    build_search_query(query),
+                    {
+                        "multi_match": {
+                            "query": " ".join(words[: settings.QUERY_MAX_CLAUSES]),
+                            "fields": FIELDS,
+                            "operator": operator,
+                        }
+                    },
+                )
+
+    def test_long_words_skip_the_guard(self):
+        for query in ["*script", "pyth~2", "/jav.*/", "((((((python))))))"]:
+            with self.subTest(query=query):
+                self.assertNotIn("query_string", json.dumps(build_search_query(query)))
+
+
+@override_settings(CACHES=LOCMEM)
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_refill(self):
+        bucket = TokenBucket("bucket:test", rate=2.0, burst=3)
+        self.assertEqual([bucket.take(now=100.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(now=100.0), 0.5)
+        self.assertAlmostEqual(bucket.take(now=100.25), 0.25)
+        self.assertEqual(bucket.take(now=100.5), 0)
+        self.assertAlmostEqual(bucket.take(now=100.5), 0.5)
+
+    def test_burst_caps_the_refill(self):
+        bucket = TokenBucket("bucket:test", rate=1.0, burst=2)
+        bucket.take(now=100.0)
+        self.assertEqual([bucket.take(now=1000.0) for _ in range(2)], [0, 0])
+        self.assertGreater(bucket.take(now=1000.0), 0)
+
+    def test_buckets_are_independent(self):
+        TokenBucket("bucket:a", rate=1.0, burst=1).take(now=100.0)
+        self.assertGreater(TokenBucket("bucket:a", rate=1.0, burst=1).take(now=100.0), 0)
+        self.assertEqual(TokenBucket("bucket:b", rate=1.0, burst=1).take(now=100.0), 0)
+
+    def test_kept_apart_from_pages_and_cards(self):
+        TokenBucket("bucket:test", rate=1.0, burst=1).take(now=100.0)
+        caches["default"].clear()
+        caches["cards"].clear()
+        self.assertGreater(TokenBucket("bucket:test", rate=1.0, burst=1).take(now=100.0), 0)
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    STATICFILES_STORAGE=STATIC,
+    ADMISSION_ROUTES={"/search/": (0.001, 2, 0.001, 3)},
+)
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_validate(self):
+        factory = RequestFactory()
+        long_query = " ".join("w{}".format(i) for i in range(settings.QUERY_REJECT_CLAUSES + 1))
+        for params, reason in [
+            ({}, None),
+            ({"q": "python", "from": "40"}, None),
+            ({"from": str(settings.ADMISSION_MAX_FROM)}, None),
+            ({"from": str(settings.ADMISSION_MAX_FROM + 1)}, "page_depth"),
+            ({"from": "-1"}, "page_depth"),
+            ({"from": "ten"}, "invalid_from"),
+            ({"source": ["s{}".format(i) for i in range(settings.ADMISSION_MAX_FILTER_VALUES)]}, None),
+            (
+                {
+                    "source": ["s{}".format(i) for i in range(settings.ADMISSION_MAX_FILTER_VALUES)],
+                    "category": "c",
+                },
+                "filter_cardinality",
+            ),
+            ({"q": "x" * (settings.QUERY_MAX_LENGTH + 1)}, "query_cost"),
+            ({"q": long_query}, "query_cost"),
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(validate(factory.get("/search/", params)), reason)
+
+    def test_rejected_request(self):
+        response = self.client.get("/search/", {"from": "ten"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response["Cache-Control"], "no-store")
+
+    def test_client_and_route_rates(self):
+        use_fake_es(size=20)
+        responses = [
+            self.client.get("/search/", {"q": "python"}, REMOTE_ADDR=address)
+            for address in ("10.0.0.1", "10.0.0.1", "10.0.0.1", "10.0.0.2", "10.0.0.3")
+        ]
+        # A burst of 2 per client and 3 for the whole route
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429, 200, 503])
+        self.assertIn("Retry-After", responses[2])
+        self.assertIn("Retry-After", responses[4])
+
+
+@override_settings(CACHES=LOCMEM, STATICFILES_STORAGE=STATIC)
+class LandingTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_overloaded_is_not_cached(self):
+        with mock.patch("rss.views.Search.count", side_effect=Overloaded):
+            response = self.client.get("/")
+        self.assertEqual(response.status_code, 503)
+        with mock.patch("rss.views.Search.count", return_value=1234):
+            response = self.client.get("/")
+        self.assertContains(response, "1234")
+
+
+class EntityTests(SimpleTestCase):
+    def test_extract(self):
+        for text, expected in [
+            ("Senior Python/Django developer, remote", (["django", "python"], ["remote"], ["senior"])),
+            ("C#/.NET engineer in New York", ([".net", "c#"], ["new york"], [])),
+            ("CI/CD. Python.", (["ci/cd", "python"], [], [])),
+            ("Java developer, not JavaScript", (["java", "javascript"], [], [])),
+            ("Work from home, entry-level", ([], ["work from home"], ["entry-level"])),
+            ("Nothing to see here", ([], [], [])),
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(extract(text), dict(zip(ENTITY_FIELDS, expected)))
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("Python/Django, .NET developer."),
+            {"python/django", "python", "django", ".net", "net", "developer.", "developer"},
+        )
+
+
+class EntityQueryTests(SimpleTestCase):
+    @override_settings(ENTITY_FILTERS=True)
+    def test_entity_filters(self):
+        self.assertEqual(
+            build_search_query("senior python fintech remote"),
+            {
+                "bool": {
+                    "filter": [
+                        {"terms": {"skills": ["python"]}},
+                        {"terms": {"locations": ["remote"]}},
+                        {"terms": {"seniority": ["senior"]}},
+                    ],
+                    "should": [{"multi_match": {"query": "fintech", "fields": ["title^2", "body"]}}],
+                    "minimum_should_match": 1,
+                }
+            },
+        )
+        self.assertEqual(
+            build_search_query("python django"),
+            {"bool": {"filter": [{"terms": {"skills": ["django", "python"]}}]}},
+        )
+
+    @override_settings(ENTITY_FILTERS=False)
+    def test_full_text(self):
+        query = build_search_query("senior python fintech remote")
+        self.assertNotIn("filter", query["bool"])
+        self.assertEqual(query["bool"]["minimum_should_match"], 1)
+        self.assertCountEqual(
+            [clause["multi_match"]["query"] for clause in query["bool"]["should"]],
+            ["python", "remote", "senior", "fintech"],
+        )
+        python = next(c for c in query["bool"]["should"] if c["multi_match"]["query"] == "python")
+        self.assertEqual(python["multi_match"]["fields"], ["title^3", "body^2", "category"])
+
+    def test_general_terms_only(self):
+        for enabled in (True, False):
+            with self.subTest(entity_filters=enabled), self.settings(ENTITY_FILTERS=enabled):
+                self.assertEqual(
+                    build_search_query("fintech startup fintech"),
+                    {
+                        "bool": {
+                            "should": [
+                                {"multi_match": {"query": "fintech", "fields": ["title^2", "body"]}},
+                                {"multi_match": {"query": "startup", "fields": ["title^2", "body"]}},
+                            ],
+                            "minimum_should_match": 1,
+                        }
+                    },
+                )
+
+
+@override_settings(CACHES=LOCMEM, STATICFILES_STORAGE=STATIC)
+class SearchCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_fake_es(size=2000)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_repeated_search(self):
+        miss = self.client.get("/search/?q=python")
+        hit = self.client.get("/search/?q=%20python%20")
+        self.assertIn("es;", miss["Server-Timing"])
+        self.assertNotIn("es;", hit["Server-Timing"])
+
+    def test_logged_as_cache_hit(self):
+        with mock.patch("rss.middleware.querylog.record") as record:
+            self.client.get("/search/?q=python")
+            self.client.get("/search/?q=python")
+        self.assertEqual([call[0][2].cache_hit for call in record.call_args_list], [False, True])
+
+    def test_cards_do_not_cull_search_results(self):
+        self.client.get("/search/?q=python")
+        # Hundreds of cards, more than the default cache holds
+        self.client.get("/jobs/")
+        for offset in range(0, 200, 50):
+            self.client.get("/source/?q=RemoteOk&from={}".format(offset))
+        hit = self.client.get("/search/?q=python")
+        self.assertNotIn("es;", hit["Server-Timing"])
+
+
+class InstrumentationTests(SimpleTestCase):
+    def test_series_carry_the_pid(self):
+        registry = MetricsRegistry()
+        registry.inc("test_total", {"route": "/search/"}, help="Test counter")
+        registry.observe("test_seconds", 0.02, help="Test histogram")
+        pid = 'pid="{}"'.format(os.getpid())
+        series = [line for line in registry.render().splitlines() if not line.startswith("#")]
+        self.assertIn('test_total{{route="/search/",{}}} 1'.format(pid), series)
+        self.assertIn('test_seconds_bucket{{{},le="0.025"}} 1'.format(pid), series)
+        self.assertTrue(all(pid in line for line in series))
+
+    @override_settings(ES_SLOW_QUERY_MS=0, ES_PROFILE_SLOW_QUERIES=True)
+    def test_slow_queries_are_profiled_after_the_slot_is_released(self):
+        use_fake_es(size=10)
+        es = connections.get_connection()
+        held, active = [], []
+        slot = admission.es_slot
+
+        @contextmanager
+        def tracked_slot():
+            # (thread, slots held by other requests at that time)
+            held.append((threading.current_thread().name, len(active)))
+            with slot():
+                active.append(1)
+                try:
+                    yield
+                finally:
+                    active.pop()
+
+        with mock.patch("rss.admission.es_slot", tracked_slot), self.assertLogs(
+            "rss.slowlog"
+        ) as logs:
+            es.search(index="rss", body={"query": {"match_all": {}}})
+            for thread in threading.enumerate():
+                if thread.name == "slow-query-profile":
+                    thread.join()
+        self.assertEqual(held, [(threading.current_thread().name, 0), ("slow-query-profile", 0)])
+        self.assertIn("profile=", logs.output[0])
+
+
+@override_settings(CACHES=LOCMEM)
+class SourceTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_raw_default(self):
+        source = Source(name="Example", url="https://example.com/feed")
+        self.assertEqual(dict(source.raw), {})
+        self.assertEqual(source.to_dict(), {})
+        self.assertEqual(source, Source.from_dict({"name": "Example", "url": "https://example.com/feed"}))
+
+    def test_stats_reuse_the_index_generation(self):
+        corpus = use_fake_es(size=50)
+        with mock.patch(
+            "rss.generation.fetch_source_counts", wraps=generation.fetch_source_counts
+        ) as fetch:
+            generation.current()
+            stats = fetch_stats(source_registry.sources)
+        self.assertEqual(fetch.call_count, 1)
+        name = corpus[0][1]["source"]
+        self.assertEqual(
+            stats[name].doc_count, sum(doc["source"] == name for _, doc in corpus)
+        )
+
+    def test_stats_unavailable(self):
+        with mock.patch(
+            "rss.generation.fetch_source_counts", side_effect=ConnectionError
+        ), self.assertLogs("rss.generation", "WARNING"):
+            self.assertIsNone(fetch_stats(source_registry.sources))
+
+
+class Interrupted(Exception):
+    pass
+
+
+class _FakeIndices:
+    def __init__(self):
+        self.created = set()
+
+    def exists(self, index):
+        return index in self.created
+
+    def create(self, index, body=None):
+        self.created.add(index)
+
+    def get_settings(self, index, name=None):
+        return {index: {"settings": {"index": {"refresh_interval": "1s"}}}}
+
+    def put_settings(self, index, body):
+        pass
+
+    def refresh(self, index):
+        pass
+
+
+class FakeBulkElasticsearch:
+    """Bulk API stand-in: refuses the ids in `refuse`, stops after `chunks` requests"""
+
+    def __init__(self, refuse=(), chunks=None):
+        self.indices = _FakeIndices()
+        self.transport = Transport([{}], connection_class=FakeConnection)
+        self.docs = {}
+        self.refuse = set(refuse)
+        self.chunks = chunks
+
+    def bulk(self, body, *args, **kwargs):
+        if self.chunks is not None:
+            if self.chunks == 0:
+                raise Interrupted()
+            self.chunks -= 1
+        lines = body.splitlines()
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            doc_id = json.loads(action)["index"]["_id"]
+            if doc_id in self.refuse:
+                items.append({"index": {"_id": doc_id, "status": 400, "error": "refused"}})
+            else:
+                self.docs[doc_id] = json.loads(source)
+                items.append({"index": {"_id": doc_id, "status": 201}})
+        return {"errors": any(i["index"]["status"] >= 300 for i in items), "items": items}
+
+
+class SnapshotImportTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.ids = []
+        for shard in range(2):
+            name = snapshots.shard_name("rss", shard, 2, "gzip")
+            with snapshots.open_shard(os.path.join(self.directory, name), "w", "gzip") as f:
+                for i in range(25):
+                    doc_id = "job-{}-{}".format(shard, i)
+                    self.ids.append(doc_id)
+                    f.write(json.dumps({"_id": doc_id, "_source": {"title": doc_id}}) + "\n")
+        manifest = {
+            "index": "rss",
+            "shards": 2,
+            "compression": "gzip",
+            "mappings": {},
+            "done": {"0": 25, "1": 25},
+        }
+        with open(os.path.join(self.directory, snapshots.MANIFEST), "w") as f:
+            json.dump(manifest, f)
+
+    def run_import(self, es, **kwargs):
+        return snapshots.import_index(es, self.directory, workers=1, chunk_size=10, **kwargs)
+
+    def test_resumes_after_the_last_chunk(self):
+        es = FakeBulkElasticsearch(chunks=2)
+        with self.assertRaises(Interrupted):
+            self.run_import(es)
+        self.assertEqual(sorted(es.docs), sorted(self.ids[:20]))
+
+        es.chunks = None
+        es.docs.clear()
+        progress = self.run_import(es)
+        # Only the jobs after the checkpoint are sent again
+        self.assertEqual(sorted(es.docs), sorted(self.ids[20:]))
+        self.assertEqual(progress.docs, 30)
+        self.assertEqual(progress.errors, 0)
+
+    def test_refused_jobs_are_retried(self):
+        es = FakeBulkElasticsearch(refuse={"job-0-3", "job-1-24"})
+        with self.assertRaisesRegex(
+            snapshots.SnapshotError, "2 jobs could not be imported"
+        ), self.assertLogs("rss.snapshots", "WARNING"):
+            self.run_import(es)
+        self.assertEqual(len(es.docs), 48)
+
+        es.refuse.clear()
+        es.docs.clear()
+        progress = self.run_import(es)
+        self.assertEqual(sorted(es.docs), ["job-0-3", "job-1-24"])
+        self.assertEqual(progress.docs, 2)
+
+        es.docs.clear()
+        self.run_import(es)
+        self.assertEqual(es.docs, {})
+
+
+@override_settings(CACHES=LOCMEM)
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.corpus = use_fake_es(size=100)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_cached_and_revalidated(self):
+        miss = self.client.get("/search/feed/?q=python")
+        hit = self.client.get("/search/feed/?q=%20python%20")
+        self.assertEqual(miss.status_code, 200)
+        self.assertIn("es;", miss["Server-Timing"])
+        self.assertNotIn("es;", hit["Server-Timing"])
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit["ETag"], miss["ETag"])
+        self.assertIn("max-age=", miss["Cache-Control"])
+
+        revalidated = self.client.get("/search/feed/?q=python", HTTP_IF_NONE_MATCH=miss["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertNotIn("es;", revalidated["Server-Timing"])
+
+    def test_formats_have_their_own_etag(self):
+        rss = self.client.get("/search/feed/?q=python")
+        atom = self.client.get("/search/feed/atom/?q=python")
+        self.assertNotEqual(rss["ETag"], atom["ETag"])
+        self.assertIn(b"<feed", atom.content)
+
+    def test_title_matches_the_query(self):
+        for q in ("Python", "python"):
+            with self.subTest(q=q):
+                response = self.client.get("/search/feed/", {"q": q})
+                self.assertContains(response, "<title>Juno Jobs - {} jobs</title>".format(q))
+
+    def test_source_feed(self):
+        name = self.corpus[0][1]["source"]
+        response = self.client.get("/source/feed/", {"q": name})
+        self.assertContains(response, "<title>Juno Jobs - {} jobs</title>".format(name))
+        other = self.client.get("/source/feed/", {"q": "Nowhere"})
+        self.assertNotEqual(response["ETag"], other["ETag"])
+
+
+class SuggestTests(SimpleTestCase):
+    weights = {
+        "python": 30,
+        "pytorch": 12,
+        "pyspark": 12,
+        "php": 20,
+        "remote": 25,
+        "react": 40,
+        "senior": 10,
+        "postgres": 5,
+    }
+
+    def test_complete(self):
+        index = PrefixIndex(self.weights, k=3)
+        for prefix, expected in [
+            ("", []),
+            ("x", []),
+            # Precomputed prefixes
+            ("p", ["python", "php", "pyspark"]),
+            ("py", ["python", "pyspark", "pytorch"]),
+            ("r", ["react", "remote"]),
+            # Bisected ranges, ties by term
+            ("pyt", ["python", "pytorch"]),
+            ("pyto", ["pytorch"]),
+            ("python", ["python"]),
+            ("pythons", []),
+        ]:
+            with self.subTest(prefix=prefix):
+                self.assertEqual(index.complete(prefix), expected)
+
+    def test_k_cap(self):
+        index = PrefixIndex(self.weights, k=3)
+        self.assertEqual(index.complete("p", k=2), ["python", "php"])
+        self.assertEqual(index.complete("p", k=10), ["python", "php", "pyspark"])
+        self.assertEqual(index.complete("py", k=1), ["python"])
+
+    def test_suggest_completes_the_last_word(self):
+        index = PrefixIndex(self.weights, k=5)
+        with mock.patch("rss.suggest.get_index", return_value=index):
+            self.assertEqual(suggest("  Senior   PY"), ["senior python", "senior pyspark", "senior pytorch"])
+            self.assertEqual(suggest("re"), ["react", "remote"])
+            self.assertEqual(len(suggest("senior p", k=2)), 2)
+            self.assertEqual(suggest("   "), [])
+
+    def test_view(self):
+        index = PrefixIndex(self.weights, k=5)
+        with mock.patch("rss.suggest.get_index", return_value=index):
+            for k, expected in [("2", 2), ("100", 5), ("-1", 1), ("0", 1), ("x", 5)]:
+                with self.subTest(k=k):
+                    response = self.client.get("/suggest/", {"q": "p", "k": k})
+                    self.assertEqual(len(response.json()["suggestions"]), expected)
+            response = self.client.get("/suggest/", {"q": "py"})
+            self.assertEqual(response.json(), {"q": "py", "suggestions": ["python", "pyspark", "pytorch"]})
+            self.assertIn("max-age=300", response["Cache-Control"])
+
+
+class AlertMatcherTests(SimpleTestCase):
+    def matches(self, query, title):
+        matcher = AlertMatcher([SavedSearch(id=1, email="a@example.com", query=query)])
+        return matcher.match({"title": title, "body": ""}) == [1]
+
+    def test_tokens_agree_with_search(self):
+        for query, title in [
+            ("django", "Senior Python/Django developer"),
+            ("senior python", "Senior Python/Django developer"),
+            ("python", "Backend engineer (Python)."),
+            (".net", "C#/.NET developer"),
+            ("c++", "Embedded C++ engineer"),
+        ]:
+            with self.subTest(query=query, title=title):
+                self.assertTrue(self.matches(query, title))
+
+    def test_all_terms_required(self):
+        self.assertFalse(self.matches("django remote", "Senior Python/Django developer"))
+
+
+@override_settings(CACHES=LOCMEM, STATICFILES_STORAGE=STATIC)
+class AlertSignupTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def signup(self, email="a@example.com", **extra):
+        return self.client.post("/alerts/new/", {"email": email, "query": "python"}, **extra)
+
+    def test_double_opt_in(self):
+        self.assertRedirects(self.signup(), "/alerts/thanks/")
+        saved_search = SavedSearch.objects.get()
+        self.assertFalse(saved_search.confirmed)
+        self.assertEqual(len(mail.outbox), 1)
+        link = "/alerts/confirm/{}/".format(saved_search.token)
+        self.assertIn(link, mail.outbox[0].body)
+
+        self.assertEqual(self.client.get(link).status_code, 200)
+        saved_search.refresh_from_db()
+        self.assertFalse(saved_search.confirmed)
+        self.assertEqual(self.client.post(link).status_code, 200)
+        saved_search.refresh_from_db()
+        self.assertTrue(saved_search.confirmed)
+
+    def test_only_confirmed_searches_match(self):
+        SavedSearch.objects.create(email="a@example.com", query="python")
+        SavedSearch.objects.create(email="b@example.com", query="python", confirmed=True)
+        with mock.patch("rss.alerts._new_docs", return_value=[]):
+            run = run_alerts()
+        self.assertEqual(run.saved_searches, 1)
+
+    def test_client_rate(self):
+        _, burst = settings.ALERTS_SIGNUP_CLIENT_RATE
+        for i in range(burst):
+            self.assertEqual(self.signup("{}@example.com".format(i)).status_code, 302)
+        response = self.signup("last@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(len(mail.outbox), burst)
+
+    def test_email_rate(self):
+        _, burst = settings.ALERTS_SIGNUP_EMAIL_RATE
+        for i in range(burst):
+            self.signup("A@example.com", REMOTE_ADDR="10.0.0.{}".format(i))
+        response = self.signup("a@example.com", REMOTE_ADDR="10.0.1.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(SavedSearch.objects.count(), burst)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        for values in ([], ["2026-10-19T01:22:00", "https://example.com/job?id=1"], [1, "é"]):
+            with self.subTest(values=values):
+                cursor = encode_cursor(values)
+                self.assertNotIn("=", cursor)
+                self.assertEqual(decode_cursor(cursor), values)
+
+    def test_invalid(self):
+        for cursor in ("", "not a cursor", "!!!", encode_cursor({"a": 1})[:-2], encode_cursor("x")):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(BadRequest):
+                    decode_cursor(cursor)
+
+
+@override_settings(CACHES=LOCMEM)
+class ApiPagingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.corpus = use_fake_es(size=25)
+
+    def test_pages_follow_the_cursor(self):
+        seen = []
+        url = "/api/v1/search/?size=10"
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(hit["id"] for hit in page["hits"])
+            url = page["next"] and "/api/v1/search/?size=10&cursor=" + page["next"]
+        self.assertEqual(seen, [doc_id for doc_id, _ in FakeConnection.docs])
+
+    def test_bad_cursor(self):
+        response = self.client.get("/api/v1/search/?cursor=%%%")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "invalid cursor"})
+
+    def test_unavailable(self):
+        down = elasticsearch.ConnectionError("N/A", "connection refused", None)
+        with mock.patch("rss.api._page", side_effect=down), self.assertLogs("rss.api"):
+            response = self.client.get("/api/v1/search/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"error": "search unavailable"})
+
+    def test_export(self):
+        response = self.client.get("/api/v1/search/export/")
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines],
+            [doc_id for doc_id, _ in FakeConnection.docs],
+        )
+
+    def test_export_overloaded_before_streaming(self):
+        with mock.patch("rss.api._search_page", side_effect=Overloaded):
+            response = self.client.get("/api/v1/search/export/")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
+
+    def test_export_waits_for_a_slot_after_the_first_page(self):
+        search_page = api._search_page
+        calls = []
+
+        def overloaded_once(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise Overloaded()
+            return search_page(*args)
+
+        with mock.patch("rss.api._search_page", side_effect=overloaded_once):
+            with self.assertLogs("rss.api", "INFO"):
+                hits = list(api.scan_hits({"match_all": {}}, page_size=10))
+        # Three pages, the second one retried
+        self.assertEqual(len(calls), 4)
+        self.assertEqual([hit["_id"] for hit in hits], [doc_id for doc_id, _ in FakeConnection.docs])
+
+
+class IndexMappingTests(SimpleTestCase):
+    def test_created_with_the_mapping(self):
+        es = mock.Mock()
+        es.indices.exists.return_value = False
+        with mock.patch("rss.views.connections.get_connection", return_value=es):
+            create_index_if_not_exists("rss")
+        body = es.indices.create.call_args[1]["body"]
+        self.assertEqual(body["mappings"]["properties"]["link"], {"type": "keyword"})
@@ -1,8 +1,9 @@
 from django.contrib.flatpages import sitemaps
 from django.contrib.sitemaps.views import sitemap
 from django.urls import path
+from django.views.decorators.http import condition
 
-from . import views
+from . import api, feeds, generation, views
 from .sitemaps import JobSitemap, StaticViewSitemap
 
 # Sitemap configuration
@@ -16,7 +17,21 @@ urlpatterns = [
     path("jobs/", views.index),
     path("job/", views.job),
     path("job/<title>/", views.job),
+    path("related/", views.related),
     path("search/", views.search),
+    path("search/feed/", feeds.search_feed),
+    path("search/feed/atom/", feeds.search_feed_atom),
     path("source/", views.source_specific),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path("source/feed/", feeds.source_feed),
+    path("source/feed/atom/", feeds.source_feed_atom),
+    path("suggest/", views.suggestions),
+    path("alerts/new/", views.saved_search_create),
+    path("alerts/thanks/", views.saved_search_thanks),
+    path("alerts/confirm/<uuid:token>/", views.confirm),
+    path("alerts/unsubscribe/<uuid:token>/", views.unsubscribe),
+    path("metrics", views.metrics),
+    path("api/v1/search/", api.search),
+    path("api/v1/search/export/", api.export),
+    path("api/v1/source/", api.source),
+    path('sitemap.xml', condition(generation.index_etag, generation.index_last_modified)(sitemap), {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
 ]
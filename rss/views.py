@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 
@@ -6,30 +7,54 @@ import math
 
 import elasticsearch
 from django import forms
-from django.shortcuts import render
-from django.http import Http404
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404, render
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.generic import CreateView, TemplateView
-from elasticsearch_dsl import Search
-from django.views.decorators.cache import cache_page
+from elasticsearch_dsl import MultiSearch, Search
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
 from elasticsearch_dsl.connections import connections
 
 from rss.postproc import postproc
-from rss.models import Feedback
+from rss.models import Feedback, SavedSearch
+from rss.sources import registry as source_registry
 from rss.sources import sources
-from rss.query_parser import build_search_query
+from rss.query_parser import build_filtered_query
+from rss.suggest import suggest
+from rss.related import related_jobs
+from rss.fragments import HOMEPAGE_ITEM, SEARCH_CARD, SOURCE_CARD, cached_cards, render_cards
+from rss.middleware import no_page_cache
+from rss.page_cache import cache_page
+from rss import generation, instrumentation
+from rss.admission import Overloaded, TokenBucket, client_id, rejection
+from rss.alerts import send_confirmation
+from rss.instrumentation import InstrumentedTransport, registry, timer
 
 from elasticsearch.exceptions import NotFoundError
 
 logger = logging.getLogger(__name__)
 
 
+def index_mappings():
+    """Mapping of the job index, shared with the Node ingester"""
+    with open(settings.MAPPINGS_PATH) as f:
+        mappings = json.load(f)
+    # Written with the `item` type of ES 6, which ES 7 no longer takes
+    return mappings.get("item", mappings)
+
+
 def create_index_if_not_exists(index_name):
+    # Sorts and filters rely on keyword fields (`link`, `source`), which
+    # dynamic mapping would make text fields
     es = connections.get_connection()
+    body = {"mappings": index_mappings()}
     try:
         if not es.indices.exists(index=index_name):
-            es.indices.create(index=index_name)
+            es.indices.create(index=index_name, body=body)
     except NotFoundError:
-        es.indices.create(index=index_name)
+        es.indices.create(index=index_name, body=body)
 
 
 import os
@@ -41,31 +66,44 @@ es_url = os.getenv("ELASTICSEARCH_URL") or "http://{host}:{port}".format(
 )
 
 try:
-    connections.create_connection(hosts=[es_url], timeout=10, retry_on_timeout=True)
+    connections.create_connection(
+        hosts=[es_url],
+        timeout=10,
+        retry_on_timeout=True,
+        transport_class=InstrumentedTransport,
+    )
     create_index_if_not_exists("rss")
 except Exception as e:
     print(f"Warning: Could not connect to Elasticsearch at {es_url}")
     print(f"Error: {e}")
     print("Server will start but search functionality will be limited.")
 
-from django.conf import settings
-
 # Cache times from settings or defaults
 ONE_WEEK = getattr(settings, 'CACHE_TIME_JOB_DETAIL', 7 * 24 * 60 * 60)
 ONE_HOUR = getattr(settings, 'CACHE_TIME_JOBS', 60 * 60)
 FIVE_MINUTES = getattr(settings, 'CACHE_TIME_SEARCH', 5 * 60)
 
 
-def _fetch_latest_for_source(source):
+def _latest_for_source_query(source):
     query_body = {
         "size": 20,
         "sort": [{"pubDate": {"unmapped_type": "date", "order": "desc"}}],
         "query": {"match_phrase": {"source": source}},
     }
-    query = Search(index="rss")
-    query.update_from_dict(query_body)
-    res = query.execute()
-    return res
+    return Search().update_from_dict(query_body)
+
+
+def _fetch_latest_for_sources(names):
+    """
+    Fetch the latest items of every source and the total job count in a
+    single _msearch round trip. Returns `(responses, count)`.
+    """
+    multi = MultiSearch(index="rss")
+    for name in names:
+        multi = multi.add(_latest_for_source_query(name))
+    multi = multi.add(Search().extra(size=0, track_total_hits=True))
+    *responses, total = multi.execute()
+    return responses, total.hits.total.value
 
 
 @cache_page(ONE_HOUR)
@@ -73,31 +111,55 @@ def landing(request):
     """Landing page view with job count."""
     try:
         total_jobs = Search(index="rss").count()
+    except Overloaded:
+        # Answered with a 503 by admission control instead of caching the fallback
+        raise
     except:
         total_jobs = "1000+"  # Fallback when ES is offline
     context = {"count": total_jobs}
-    return render(request, "rss/landing.html", context)
+    return _render(request, "rss/landing.html", context)
 
 
+# The page cache is outside `condition` so that cached pages keep the ETag
 @cache_page(ONE_HOUR)
+@condition(generation.index_etag, generation.index_last_modified)
 def index(request):
     context = {"sources": [], "count": 0}
     try:
-        for source in sources:
-            if "show_in_homepage" not in source:
-                source["show_in_homepage"] = True
-            items = _fetch_latest_for_source(source["name"])
+        # Sources known to have no job are skipped without querying ES
+        shown = [s for s in sources if s.show_in_homepage and source_registry.has_jobs(s.name)]
+        responses, total_jobs = _fetch_latest_for_sources([s.name for s in shown])
+        for source, items in zip(shown, responses):
             if items:
-                context["sources"].append({"desc": source, "items": items})
-
-        total_jobs = Search(index="rss").count()
+                context["sources"].append(
+                    {
+                        "desc": source,
+                        "items": items,
+                        "cards": render_cards(items, HOMEPAGE_ITEM),
+                    }
+                )
         context["count"] = total_jobs
+    except Overloaded:
+        raise
     except:
         # Graceful degradation when ES is offline
         context["count"] = "1000+"
         context["es_offline"] = True
 
-    return render(request, "rss/index.html", context)
+    return _render(request, "rss/index.html", context)
+
+
+def _render(request, template_name, context):
+    with timer("render"):
+        return render(request, template_name, context)
+
+
+def _offset(request):
+    """`from` parameter of listing pages, invalid values start from the top"""
+    try:
+        return max(int(request.GET.get("from", 0)), 0)
+    except ValueError:
+        return 0
 
 
 def _convert_dates(hits):
@@ -106,102 +168,111 @@ def _convert_dates(hits):
             hit["pubDate"] = dateutil.parser.parse(hit["pubDate"])
 
 
-@cache_page(FIVE_MINUTES)
+def _timed_convert_dates(hits):
+    with timer("dates"):
+        _convert_dates(hits)
+
+
+def _search_cache_key(q, sources, categories, date_filter, _from):
+    """Same key for searches that only differ in spacing or filter order"""
+    raw = json.dumps(
+        [" ".join(q.split()), sorted(set(sources)), sorted(set(categories)), date_filter, _from]
+    )
+    return "search:{}".format(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+
+
+def _cached_search(key, q):
+    """`(cards, total_hits)` of a recent identical search, None on a miss"""
+    with timer("cache"):
+        cached = cache.get(key)
+        cards = None
+        if cached is not None:
+            doc_ids, total_hits = cached
+            cards = cached_cards(doc_ids, SEARCH_CARD, q)
+    metrics = instrumentation.current()
+    if metrics is not None and cards is not None:
+        # Counted in the query log's cache hit ratio like page cache hits
+        metrics.cache_hit = True
+    registry.inc(
+        "junojobs_search_cache_total",
+        {"result": "miss" if cards is None else "hit"},
+        help="Search result (hit ids and total) cache lookups",
+    )
+    return None if cards is None else (cards, total_hits)
+
+
+@no_page_cache
 def search(request):
     SIZE = 40
     q = request.GET.get("q", "")
-    _from = int(request.GET.get("from", 0))
+    _from = _offset(request)
 
     # Get filter parameters
     selected_sources = request.GET.getlist("source")
     selected_categories = request.GET.getlist("category")
     date_filter = request.GET.get("date", "")
 
-    # Build query
-    query = Search(index="rss")
-
-    # Base query with natural language search (no boolean operators needed)
-    if q:
-        base_query = build_search_query(q)
+    # Only the hit ids and total are cached, pages are built from the cached
+    # job cards so that cache memory still grows with documents
+    key = _search_cache_key(q, selected_sources, selected_categories, date_filter, _from)
+    cached = _cached_search(key, q)
+    if cached is not None:
+        cards, total_hits = cached
     else:
-        base_query = {"match_all": {}}
-
-    # Build filters
-    filters = []
-
-    # Source filter
-    if selected_sources:
-        filters.append({"terms": {"source": selected_sources}})
-
-    # Category filter
-    if selected_categories:
-        filters.append({"terms": {"category": selected_categories}})
-
-    # Date filter
-    if date_filter:
-        date_ranges = {
-            "24h": "now-1d/d",
-            "7d": "now-7d/d",
-            "30d": "now-30d/d"
+        query = Search(index="rss")
+        with timer("parse"):
+            final_query = build_filtered_query(
+                q, selected_sources, selected_categories, date_filter
+            )
+
+        # Build query body without aggregations (they cause issues with field mappings)
+        query_body = {
+            "size": SIZE,
+            "from": _from,
+            "query": final_query,
+            "sort": [{"pubDate": {"order": "desc", "unmapped_type": "date"}}],
         }
-        if date_filter in date_ranges:
-            filters.append({
-                "range": {
-                    "pubDate": {
-                        "gte": date_ranges[date_filter]
-                    }
-                }
-            })
-
-    # Combine query and filters
-    if filters:
-        final_query = {
-            "bool": {
-                "must": base_query,
-                "filter": filters
-            }
-        }
-    else:
-        final_query = base_query
-
-    # Build query body without aggregations (they cause issues with field mappings)
-    query_body = {
-        "size": SIZE,
-        "from": _from,
-        "query": final_query,
-        "sort": [{"pubDate": {"order": "desc", "unmapped_type": "date"}}],
-    }
 
-    query.update_from_dict(query_body)
-
-    try:
-        res = query.execute()
-    except elasticsearch.RequestError as err:
-        # Log the actual error for debugging
-        import traceback
-        print(f"Elasticsearch error for query: {q}")
-        print(f"Error details: {err.info}")
-        print(traceback.format_exc())
-
-        json_error = json.dumps(err.info["error"]["root_cause"], indent=4)
-        return render(
-            request, "rss/search_error.html", {"json_error": json_error, "q": q}
-        )
-    except Exception as e:
-        # Catch any other errors
-        import traceback
-        print(f"Unexpected error during search: {str(e)}")
-        print(traceback.format_exc())
-        return render(
-            request, "rss/search_error.html", {"json_error": str(e), "q": q}
-        )
-
-    _convert_dates(res.hits)
-    total_hits = res["hits"]["total"]["value"]
+        query.update_from_dict(query_body)
+
+        try:
+            res = query.execute()
+        except elasticsearch.RequestError as err:
+            logger.warning(
+                "Elasticsearch error for query %r: %s", q, err.info, exc_info=True
+            )
+            registry.inc(
+                "junojobs_search_errors_total",
+                {"kind": "request"},
+                help="Searches that failed in Elasticsearch",
+            )
+            json_error = json.dumps(err.info["error"]["root_cause"], indent=4)
+            return _render(
+                request, "rss/search_error.html", {"json_error": json_error, "q": q}
+            )
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.exception("Unexpected error during search for query %r", q)
+            registry.inc(
+                "junojobs_search_errors_total",
+                {"kind": "unexpected"},
+                help="Searches that failed in Elasticsearch",
+            )
+            return _render(
+                request, "rss/search_error.html", {"json_error": str(e), "q": q}
+            )
+
+        total_hits = res["hits"]["total"]["value"]
+        cards = render_cards(res.hits, SEARCH_CARD, q, prepare=_timed_convert_dates)
+        cache.set(key, ([hit.meta.id for hit in res.hits], total_hits), FIVE_MINUTES)
+
+    request._query_hits = total_hits
 
     context = {
         "q": q,
-        "hits": res.hits,
+        "hits": cards,
+        "cards": cards,
         "total_hits": total_hits,
         "has_prev": _from != 0,
         "has_next": (total_hits - _from - SIZE) > 0,
@@ -212,7 +283,7 @@ def search(request):
         "selected_categories": selected_categories,
         "date_filter": date_filter,
     }
-    return render(request, "rss/search.html", context)
+    return _render(request, "rss/search.html", context)
 
 
 @cache_page(ONE_HOUR)
@@ -221,6 +292,7 @@ def popular(request, name=None):
 
 
 @cache_page(ONE_WEEK)
+@condition(etag_func=generation.job_etag)
 def job(request, title=None):
     id = request.GET.get("id", None)
     if id is None:
@@ -238,19 +310,37 @@ def job(request, title=None):
         logger.error(f"Error in postproc for doc {id}: {str(e)}", exc_info=True)
         # Continue rendering even if postproc fails
     context = {"q": q, "hit": doc}
-    return render(request, "rss/job.html", context)
+    return _render(request, "rss/job.html", context)
+
+
+# Browsers and the page cache keep the panel for the same time: a max-age
+# would override the timeout of `cache_page`
+@cache_page(ONE_HOUR)
+def related(request):
+    """Related jobs panel of a job page, loaded separately by the page"""
+    id = request.GET.get("id", None)
+    if id is None:
+        raise Http404("id param not provided.")
+    try:
+        hits = related_jobs(id)
+    except NotFoundError:
+        hits = []
+    context = {"cards": render_cards(hits, HOMEPAGE_ITEM, prepare=_timed_convert_dates)}
+    return _render(request, "rss/related.html", context)
 
 
 @cache_page(ONE_WEEK)
 def data_sources(request):
-    sources_json = json.dumps(sources, indent=4)
-    return render(request, "rss/data_sources.html", {"sources_json": sources_json})
+    sources_json = source_registry.to_json(indent=4)
+    return _render(request, "rss/data_sources.html", {"sources_json": sources_json})
 
 
+@condition(generation.source_etag, generation.source_last_modified)
+@no_page_cache
 def source_specific(request):
     q = request.GET.get("q", "")
     SIZE = 50
-    _from = int(request.GET.get("from", 0))
+    _from = _offset(request)
     query = Search(index="rss")
     query_body = {
         "size": SIZE,
@@ -262,14 +352,14 @@ def source_specific(request):
         res = query.execute()
     except elasticsearch.RequestError as err:
         json_error = json.dumps(err.info["error"]["root_cause"], indent=4)
-        return render(
+        return _render(
             request, "rss/search_error.html", {"json_error": json_error, "q": q}
         )
-    _convert_dates(res.hits)
     total_hits = res["hits"]["total"]["value"]
     context = {
         "q": q,
         "hits": res.hits,
+        "cards": render_cards(res.hits, SOURCE_CARD, q, prepare=_timed_convert_dates),
         "total_hits": total_hits,
         "has_prev": _from != 0,
         "has_next": (total_hits - _from - SIZE) > 0,
@@ -277,7 +367,20 @@ def source_specific(request):
         "next": _from + SIZE,
         "page_num": (math.floor(_from / SIZE) + 1),
     }
-    return render(request, "rss/source.html", context)
+    return _render(request, "rss/source.html", context)
+
+
+@cache_control(max_age=300)
+def suggestions(request):
+    q = request.GET.get("q", "")[:100]
+    try:
+        # At least one, the index caps it at SUGGEST_MAX_RESULTS
+        k = max(int(request.GET.get("k", 8)), 1)
+    except ValueError:
+        k = 8
+    with timer("suggest"):
+        results = suggest(q, k)
+    return JsonResponse({"q": q, "suggestions": results})
 
 
 class FeedbackCreate(CreateView):
@@ -292,4 +395,82 @@ class FeedbackCreate(CreateView):
 
 feedback_create = FeedbackCreate.as_view(success_url="/feedback/thanks")
 feedback_thanks = TemplateView.as_view(template_name="rss/feedback_thanks.html")
+
+
+class SavedSearchCreate(CreateView):
+    model = SavedSearch
+    fields = ["email", "query", "sources", "categories"]
+
+    def get_initial(self):
+        return {
+            "query": self.request.GET.get("q", "")[:200],
+            "sources": "\n".join(self.request.GET.getlist("source")),
+            "categories": "\n".join(self.request.GET.getlist("category")),
+        }
+
+    def get_form(self):
+        form = super(SavedSearchCreate, self).get_form()
+        form.fields["query"].label = "Search"
+        form.fields["sources"].widget = forms.HiddenInput()
+        form.fields["categories"].widget = forms.HiddenInput()
+        return form
+
+    def post(self, request, *args, **kwargs):
+        # Every signup sends an email: limit them per client and per address
+        wait = TokenBucket(
+            "bucket:alerts:{}".format(client_id(request)), *settings.ALERTS_SIGNUP_CLIENT_RATE
+        ).take()
+        if wait:
+            return rejection(request, 429, "client_rate", "/alerts/new/", wait)
+        return super(SavedSearchCreate, self).post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        email = form.cleaned_data["email"].lower().encode("utf-8")
+        wait = TokenBucket(
+            "bucket:alerts:email:{}".format(hashlib.sha1(email).hexdigest()),
+            *settings.ALERTS_SIGNUP_EMAIL_RATE
+        ).take()
+        if wait:
+            return rejection(self.request, 429, "email_rate", "/alerts/new/", wait)
+        response = super(SavedSearchCreate, self).form_valid(form)
+        send_confirmation(self.object, settings.ALERTS_BASE_URL.rstrip("/"))
+        return response
+
+
+saved_search_create = never_cache(
+    SavedSearchCreate.as_view(success_url="/alerts/thanks/")
+)
+saved_search_thanks = TemplateView.as_view(template_name="rss/alert_thanks.html")
+
+
+@never_cache
+def confirm(request, token):
+    saved_search = get_object_or_404(SavedSearch, token=token)
+    # Only a POST confirms, so that link scanners of mail providers cannot
+    if request.method == "POST":
+        saved_search.confirmed = True
+        saved_search.save(update_fields=["confirmed"])
+        return _render(request, "rss/alert_confirmed.html", {"query": saved_search.query})
+    return _render(request, "rss/alert_confirm.html", {"saved_search": saved_search})
+
+
+@never_cache
+def unsubscribe(request, token):
+    saved_search = get_object_or_404(SavedSearch, token=token)
+    if request.method == "POST":
+        saved_search.delete()
+        return _render(request, "rss/alert_unsubscribed.html", {"query": saved_search.query})
+    return _render(request, "rss/alert_unsubscribe.html", {"saved_search": saved_search})
+
+
 opensearch = TemplateView.as_view(template_name="rss/opensearch.xml")
+
+
+@never_cache
+def metrics(request):
+    """Prometheus metrics for this process, only served to local scrapers"""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
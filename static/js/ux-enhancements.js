@@ -209,7 +209,7 @@
         e.stopPropagation();
 
         const jobTitle = btn.getAttribute('data-job-title') || 'Check out this job';
-        const jobUrl = btn.getAttribute('data-job-url') || window.location.href;
+        const jobUrl = new URL(btn.getAttribute('data-job-url') || '', window.location.href).href;
 
         // Use native share API if available
         if (navigator.share) {
@@ -389,6 +389,57 @@
     });
   }
 
+  /**
+   * Search Suggestions (served by /suggest/ from an in-memory index)
+   */
+  function initSearchSuggestions() {
+    document.querySelectorAll('form[action="/search/"] input[name="q"]').forEach(function(input, i) {
+      const datalist = document.createElement('datalist');
+      datalist.id = 'q-suggestions-' + i;
+      input.parentNode.appendChild(datalist);
+      input.setAttribute('list', datalist.id);
+
+      let debounceTimeout;
+      let lastQuery = '';
+      input.addEventListener('input', function() {
+        clearTimeout(debounceTimeout);
+        debounceTimeout = setTimeout(function() {
+          const query = input.value.trim();
+          if (query.length < 2 || query === lastQuery) return;
+          lastQuery = query;
+          fetch('/suggest/?q=' + encodeURIComponent(query))
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+              if (data.q !== input.value.trim().slice(0, 100)) return;
+              datalist.innerHTML = '';
+              data.suggestions.forEach(function(suggestion) {
+                const option = document.createElement('option');
+                option.value = suggestion;
+                datalist.appendChild(option);
+              });
+            })
+            .catch(function() {});
+        }, 120);
+      });
+    });
+  }
+
+  /**
+   * Related Jobs (job pages are cached longer than their related jobs panel)
+   */
+  function initRelatedJobs() {
+    document.querySelectorAll('[data-related-url]').forEach(function(panel) {
+      fetch(panel.dataset.relatedUrl)
+        .then(function(response) { return response.ok ? response.text() : ''; })
+        .then(function(html) {
+          if (!html.trim()) return;
+          panel.innerHTML = html;
+          panel.classList.remove('hidden');
+        })
+        .catch(function() {});
+    });
+  }
+
   // ============================================
   // PHASE 4: Performance & Polish
   // ============================================
@@ -481,6 +532,8 @@
     initScrollPreservation();
     initFilterCounters();
     initSearchBarEnhancements();
+    initSearchSuggestions();
+    initRelatedJobs();
 
     // Phase 4: Performance & polish
     initLazyLoading();